@@ -0,0 +1,180 @@
+"""在 AstrBot 之外加载插件：模拟 Context / AstrMessageEvent / HTTP 路由注册
+
+未安装 AstrBot 时会注入一个最小的 astrbot.api 模块，只提供插件用到的接口。
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+import types
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def install_fake_astrbot() -> None:
+    """AstrBot 不可用时注入最小实现；已安装时什么都不做"""
+    if "astrbot" in sys.modules or importlib.util.find_spec("astrbot") is not None:
+        return
+
+    api = types.ModuleType("astrbot.api")
+    api.logger = logging.getLogger("astrbot")
+
+    event = types.ModuleType("astrbot.api.event")
+
+    class _Filter:
+        class EventMessageType:
+            ALL = "all"
+
+        class PermissionType:
+            ADMIN = "admin"
+
+        def __getattr__(self, name):
+            # 装饰器只需原样返回函数
+            return lambda *args, **kwargs: (lambda fn: fn)
+
+    event.AstrMessageEvent = FakeEvent
+    event.filter = _Filter()
+
+    star = types.ModuleType("astrbot.api.star")
+
+    class Star:
+        def __init__(self, context):
+            self.context = context
+
+    class StarTools:
+        data_dir = ""
+
+        @classmethod
+        def get_data_dir(cls, name: str) -> str:
+            return cls.data_dir
+
+    star.Context = FakeContext
+    star.Star = Star
+    star.StarTools = StarTools
+    star.register = lambda *args, **kwargs: (lambda cls: cls)
+
+    provider = types.ModuleType("astrbot.api.provider")
+    provider.Provider = FakeProvider
+
+    root = types.ModuleType("astrbot")
+    root.api = api
+    api.event, api.star, api.provider = event, star, provider
+    sys.modules.update({
+        "astrbot": root,
+        "astrbot.api": api,
+        "astrbot.api.event": event,
+        "astrbot.api.star": star,
+        "astrbot.api.provider": provider,
+    })
+
+
+class FakeProvider:
+    """记录插件注册的 HTTP 路由，压测时直接调用处理函数"""
+
+    def __init__(self):
+        self.routes: Dict[str, object] = {}
+
+    def register_http_route(self, path: str, methods: List[str], handler) -> None:
+        self.routes[path] = handler
+
+
+class FakeContext:
+    """插件上下文：提供配置路径、路由注册，并记录发出的群消息"""
+
+    def __init__(self, config_path: str, send_latency: float = 0.0):
+        self.config_path = config_path
+        self.send_latency = send_latency
+        self.provider = FakeProvider()
+        # (群号, 消息, 发送完成时间)
+        self.sent: List[Tuple[str, str, float]] = []
+
+    def get_config_path(self, filename: str) -> str:
+        return self.config_path
+
+    def get_provider(self):
+        return self.provider
+
+    async def send_message(self, message_type: str, target_id: str, message: str) -> None:
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.sent.append((target_id, message, time.perf_counter()))
+
+
+class FakeEvent:
+    """QQ 消息事件：message_str 为去掉唤醒前缀 / 之后的文本，与 AstrBot 一致"""
+
+    def __init__(self, text: str, group_id: str = "10000", admin: bool = True, sender_id: str = "10001"):
+        self.message_str = text
+        self.is_at_or_wake_command = True
+        self.group_id = group_id
+        self.sender_id = sender_id
+        self.admin = admin
+        self.stopped = False
+
+    def get_group_id(self) -> str:
+        return self.group_id
+
+    def get_sender_id(self) -> str:
+        return self.sender_id
+
+    def is_admin(self) -> bool:
+        return self.admin
+
+    def stop_event(self) -> None:
+        self.stopped = True
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+
+class FakeRequest:
+    """HTTP 请求对象，只实现插件用到的 headers、read() 和 json()"""
+
+    def __init__(self, payload, headers: Optional[Dict[str, str]] = None):
+        self.payload = payload
+        self.headers = headers or {}
+
+    async def read(self) -> bytes:
+        return json.dumps(self.payload, ensure_ascii=False).encode("utf-8")
+
+    async def json(self):
+        return self.payload
+
+
+def load_plugin(config: dict, workdir: str, send_latency: float = 0.0):
+    """写入配置并实例化插件，返回 (插件, 上下文)；需要在事件循环中调用"""
+    install_fake_astrbot()
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+
+    star = importlib.import_module("astrbot.api.star")
+    if hasattr(star.StarTools, "data_dir"):
+        star.StarTools.data_dir = os.path.join(workdir, "data")
+        os.makedirs(star.StarTools.data_dir, exist_ok=True)
+
+    main = importlib.import_module("main")
+    context = FakeContext(config_path, send_latency)
+    return main.Main(context), context
+
+
+async def run_command(
+    plugin, text: str, group_id: str = "10000", sender_id: str = "10001"
+) -> Tuple[List[str], Optional[BaseException]]:
+    """执行一条命令，返回全部回复；插件内部抛出的异常一并返回"""
+    replies = []
+    try:
+        async for reply in plugin.on_message(FakeEvent(text, group_id, sender_id=sender_id)):
+            replies.append(reply)
+    except Exception as e:
+        return replies, e
+    return replies, None
@@ -0,0 +1,253 @@
+"""本地 XenForo API 模拟服务，用于压测插件
+
+模拟 /api/threads、/api/threads/{id}、/api/threads/{id}/posts、/api/posts、/api/forums、
+/api/forums/{id}、/api/index、/api/users/find-name、/api/users，可配置响应延迟、5xx 错误率和 429 限流率，
+并统计每个端点收到的请求数。
+
+单独运行（手动调试插件时把 xf_url 指向它）：
+    python bench/mock_xenforo.py --port 8081 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class MockXenForo:
+    def __init__(
+        self,
+        latency: float = 0.02,
+        jitter: float = 0.01,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 1,
+        threads: int = 200,
+        forums: int = 30,
+        users: int = 500,
+        per_page: int = 20,
+        api_key: str = "bench",
+        seed: int = 1,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.per_page = per_page
+        self.api_key = api_key
+        self._random = random.Random(seed)
+        # 按端点（ID 归一为 :id）统计请求数和状态码
+        self.requests: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self._runner = None
+
+        now = int(time.time())
+        self.threads = [
+            {
+                "thread_id": i,
+                "node_id": 1 + i % forums,
+                "title": f"测试主题 {i}：XenForo 插件 benchmark",
+                "username": f"user{i % users}",
+                "reply_count": self._random.randint(0, 300),
+                "view_count": self._random.randint(10, 50000),
+                "first_post_reaction_score": self._random.randint(0, 50),
+                "post_date": now - i * 600,
+                "last_post_date": now - i * 60,
+                "discussion_state": "visible",
+            }
+            for i in range(threads, 0, -1)
+        ]
+        self.posts = [
+            {
+                "post_id": i,
+                "thread_id": 1 + i % threads,
+                "username": f"user{i % users}",
+                "position": i % 10,
+                "is_first_post": i % 10 == 0,
+                "message": f"第 {i} 条回复的内容",
+                "post_date": now - i * 30,
+                "Thread": {"thread_id": 1 + i % threads, "title": f"测试主题 {1 + i % threads}"},
+            }
+            for i in range(threads * 5, 0, -1)
+        ]
+        self.forums = [
+            {"node_id": i, "title": f"板块 {i}", "discussion_count": self._random.randint(0, 5000)}
+            for i in range(1, forums + 1)
+        ]
+        self.users = {
+            f"user{i}": {
+                "user_id": i + 1,
+                "username": f"user{i}",
+                "message_count": self._random.randint(0, 9000),
+                "reaction_score": self._random.randint(0, 900),
+                "register_date": now - i * 86400,
+                "view_url": f"/members/user{i}.{i + 1}/",
+            }
+            for i in range(users)
+        }
+
+    # ---- 服务生命周期 ----
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/api/threads", self._threads)
+        app.router.add_get("/api/threads/{thread_id}", self._thread)
+        app.router.add_get("/api/threads/{thread_id}/posts", self._thread_posts)
+        app.router.add_get("/api/posts", self._posts)
+        app.router.add_get("/api/forums", self._forums)
+        app.router.add_get("/api/forums/{node_id}", self._forum)
+        app.router.add_get("/api/index", self._index)
+        app.router.add_get("/api/users/find-name", self._find_user)
+        app.router.add_get("/api/users", self._users)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """启动服务，返回站点地址（port=0 时随机选择空闲端口）"""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # ---- 故障注入 ----
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        endpoint = re.sub(r"/\d+(?=/|$)", "/:id", request.path)
+        self.requests[endpoint] += 1
+        delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+        if request.headers.get("XF-Api-Key") != self.api_key:
+            response = self._error(401, "invalid_api_key")
+        elif self._random.random() < self.throttle_rate:
+            response = self._error(429, "too_many_requests")
+            response.headers["Retry-After"] = str(self.retry_after)
+        elif self._random.random() < self.error_rate:
+            response = self._error(500, "server_error")
+        else:
+            response = await handler(request)
+        self.statuses[(endpoint, response.status)] += 1
+        return response
+
+    @staticmethod
+    def _error(status: int, code: str) -> web.Response:
+        return web.json_response({"errors": [{"code": code, "message": code}]}, status=status)
+
+    # ---- 端点 ----
+
+    def _page(self, request: web.Request, items: list, key: str) -> web.Response:
+        per_page = max(1, min(100, int(request.query.get("limit") or self.per_page)))
+        page = max(1, int(request.query.get("page") or 1))
+        last_page = max(1, -(-len(items) // per_page))
+        body = {
+            key: items[(page - 1) * per_page : page * per_page],
+            "pagination": {"current_page": page, "last_page": last_page, "per_page": per_page, "total": len(items)},
+        }
+        etag = f'"{key}-{page}-{per_page}-{len(items)}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.json_response(body, headers={"ETag": etag})
+
+    async def _threads(self, request: web.Request) -> web.Response:
+        threads = self.threads
+        if request.query.get("order") == "last_post_date":
+            threads = sorted(threads, key=lambda t: t["last_post_date"], reverse=True)
+        return self._page(request, threads, "threads")
+
+    async def _thread(self, request: web.Request) -> web.Response:
+        thread_id = int(request.match_info["thread_id"])
+        thread = next((t for t in self.threads if t["thread_id"] == thread_id), None)
+        if thread is None:
+            return self._error(404, "requested_thread_not_found")
+        thread = dict(thread)
+        thread["Forum"] = self._forum_record(thread["node_id"])
+        if request.query.get("with_first_post"):
+            thread["FirstPost"] = {"message": f"主题 {thread_id} 的首帖内容"}
+        return web.json_response({"thread": thread})
+
+    async def _thread_posts(self, request: web.Request) -> web.Response:
+        thread_id = int(request.match_info["thread_id"])
+        thread = next((t for t in self.threads if t["thread_id"] == thread_id), None)
+        if thread is None:
+            return self._error(404, "requested_thread_not_found")
+        posts = [
+            {"post_id": thread_id * 1000 + i, "thread_id": thread_id, "username": f"user{i}", "position": i,
+             "is_first_post": i == 0, "message": f"主题 {thread_id} 的第 {i} 楼"}
+            for i in range(thread["reply_count"] + 1)
+        ]
+        return self._page(request, posts, "posts")
+
+    async def _posts(self, request: web.Request) -> web.Response:
+        return self._page(request, self.posts, "posts")
+
+    async def _forums(self, request: web.Request) -> web.Response:
+        return self._page(request, self.forums, "forums")
+
+    def _forum_record(self, node_id: int) -> dict:
+        forum = dict(self.forums[(node_id - 1) % len(self.forums)])
+        forum["breadcrumbs"] = [{"node_id": 0, "title": "讨论区"}]
+        return forum
+
+    async def _forum(self, request: web.Request) -> web.Response:
+        node_id = int(request.match_info["node_id"])
+        if not 1 <= node_id <= len(self.forums):
+            return self._error(404, "requested_forum_not_found")
+        return web.json_response({"forum": self._forum_record(node_id)})
+
+    async def _index(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "statistics": {"threads": len(self.threads), "messages": len(self.posts), "users": len(self.users)},
+        })
+
+    async def _find_user(self, request: web.Request) -> web.Response:
+        username = (request.query.get("username") or "").casefold()
+        exact = self.users.get(username)
+        recommendations = [u for name, u in self.users.items() if name.startswith(username)][:5] if not exact else []
+        return web.json_response({"exact": exact, "recommendations": recommendations})
+
+    async def _users(self, request: web.Request) -> web.Response:
+        return self._page(request, list(self.users.values()), "users")
+
+
+async def _serve(args) -> None:
+    mock = MockXenForo(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, api_key=args.api_key,
+    )
+    url = await mock.start(args.host, args.port)
+    print(f"模拟 XenForo 已启动: {url}（API Key: {args.api_key}），Ctrl+C 退出")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await mock.stop()
+        print(json.dumps({" ".join(map(str, k)): v for k, v in mock.statuses.items()}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 XenForo API 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--api-key", default="bench")
+    parser.add_argument("--latency", type=float, default=0.02, help="平均响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01, help="延迟抖动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 的比例")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,222 @@
+"""插件压测：启动本地模拟 XenForo，按指定并发执行命令和通知，输出吞吐、延迟分位数和上游请求数
+
+    python bench/run.py --requests 500 --concurrency 20
+    python bench/run.py --commands "论坛,热门,主题 3,用户 user1" --latency 0.1 --throttle-rate 0.05
+    python bench/run.py --requests 0 --notify 2000 --send-latency 0.01
+    python bench/run.py --no-cache --json > bench_output.txt
+
+需要 aiohttp；未安装 AstrBot 时使用 harness 中的模拟实现。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import FakeRequest, load_plugin, run_command  # noqa: E402
+from mock_xenforo import MockXenForo  # noqa: E402
+
+DEFAULT_COMMANDS = "论坛,热门,回复,统计,板块,主题 3,用户 user1,搜索 插件"
+ERROR_PREFIXES = ("出错了", "请求失败", "API错误", "论坛暂时无法访问")
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    return {
+        "count": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+    }
+
+
+async def bench_commands(plugin, commands: list, total: int, concurrency: int, groups: int) -> dict:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(index: int) -> None:
+        text = commands[index % len(commands)]
+        async with semaphore:
+            started = time.perf_counter()
+            replies, exc = await run_command(
+                plugin, text, group_id=str(10000 + index % max(1, groups)), sender_id=str(30000 + index)
+            )
+            latencies[text].append(time.perf_counter() - started)
+        if exc is not None or not replies or any(r.startswith(ERROR_PREFIXES) for r in replies):
+            errors[text] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    result = {"elapsed_s": round(elapsed, 3), "commands": {}}
+    for text in commands:
+        result["commands"][text] = {**summarize(latencies[text], elapsed), "errors": errors[text]}
+    everything = [v for values in latencies.values() for v in values]
+    result["total"] = {**summarize(everything, elapsed), "errors": sum(errors.values())}
+    return result
+
+
+async def bench_notify(plugin, context, total: int, concurrency: int, groups: int, timeout: float) -> dict:
+    handler = context.provider.routes.get("/xenforo/notify")
+    if handler is None:
+        return {"error": "插件未注册 /xenforo/notify"}
+    submitted = {}
+    statuses = defaultdict(int)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(index: int) -> None:
+        message = f"bench-notify-{index}"
+        async with semaphore:
+            submitted[message] = time.perf_counter()
+            _, status = await handler(FakeRequest({
+                "group_id": str(20000 + index % max(1, groups)),
+                "message": message,
+                "event_type": "thread_create",
+            }))
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    accepted_at = time.perf_counter()
+    deadline = accepted_at + timeout
+    while len(context.sent) < statuses.get(202, 0) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    finished = time.perf_counter()
+
+    # 端到端延迟：提交通知 -> 插件调用 send_message 完成
+    delivered = [sent_at - submitted[message] for _, message, sent_at in context.sent if message in submitted]
+    return {
+        "submitted": total,
+        "statuses": dict(statuses),
+        "accept_throughput": round(total / (accepted_at - started), 1) if accepted_at > started else 0,
+        "delivered": len(delivered),
+        "delivery": summarize(delivered, finished - started),
+    }
+
+
+def print_report(result: dict) -> None:
+    commands = result.get("commands")
+    if commands:
+        print(f"\n== 命令（{commands['elapsed_s']}s）==")
+        print(f"{'命令':<16}{'次数':>8}{'吞吐/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'错误':>8}")
+        rows = list(commands["commands"].items()) + [("合计", commands["total"])]
+        for name, row in rows:
+            print(
+                f"{name:<16}{row['count']:>8}{row['throughput']:>10}{row['p50_ms']:>10}"
+                f"{row['p99_ms']:>10}{row['max_ms']:>10}{row['errors']:>8}"
+            )
+
+    notify = result.get("notify")
+    if notify:
+        print("\n== 通知 ==")
+        if "error" in notify:
+            print(notify["error"])
+        else:
+            delivery = notify["delivery"]
+            print(f"提交 {notify['submitted']}，状态码 {notify['statuses']}，接收吞吐 {notify['accept_throughput']}/s")
+            print(
+                f"送达 {notify['delivered']}，送达吞吐 {delivery['throughput']}/s，"
+                f"p50 {delivery['p50_ms']} ms，p99 {delivery['p99_ms']} ms"
+            )
+
+    print("\n== 上游请求 ==")
+    upstream = result["upstream"]
+    for endpoint, count in sorted(upstream["requests"].items()):
+        statuses = ", ".join(f"{status}: {n}" for status, n in sorted(upstream["statuses"].get(endpoint, {}).items()))
+        print(f"{endpoint:<24}{count:>8}  ({statuses})")
+    print(f"{'合计':<24}{upstream['total']:>8}")
+
+
+async def main(args) -> dict:
+    mock = MockXenForo(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+    )
+    base_url = await mock.start()
+    result = {"args": vars(args)}
+    with tempfile.TemporaryDirectory(prefix="xf-bench-") as workdir:
+        config = {
+            "xf_url": base_url,
+            "xf_api_key": mock.api_key,
+            "rate_limit": args.rate_limit,
+            "rate_burst": max(1, int(args.rate_limit * 2)),
+            "cache_persist": args.persist,
+            "prefetch_interval": args.prefetch,
+            # 压测模拟的是大量不同用户，默认不做命令限流；需要时用 --config 打开
+            "command_user_limit": 0,
+            "command_group_limit": 0,
+            # 同理默认不做发送调度限速，测的是插件本身的处理能力
+            "send_rate": 0,
+            "send_group_interval": 0,
+        }
+        if args.no_cache:
+            config["cache_ttl"] = {"threads": 0, "threads/:id/posts": 0, "forums": 0, "forums/:id": 0, "index": 0}
+        if args.config:
+            config.update(json.loads(args.config))
+
+        plugin, context = load_plugin(config, workdir, send_latency=args.send_latency)
+        try:
+            commands = [c.strip() for c in args.commands.split(",") if c.strip()]
+            if args.requests and commands:
+                result["commands"] = await bench_commands(plugin, commands, args.requests, args.concurrency, args.groups)
+            if args.notify:
+                result["notify"] = await bench_notify(
+                    plugin, context, args.notify, args.concurrency, args.groups, args.notify_timeout
+                )
+        finally:
+            await plugin.terminate()
+            await mock.stop()
+
+    statuses = defaultdict(dict)
+    for (endpoint, status), count in mock.statuses.items():
+        statuses[endpoint][status] = count
+    result["upstream"] = {
+        "total": sum(mock.requests.values()),
+        "requests": dict(mock.requests),
+        "statuses": dict(statuses),
+    }
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="XenForo 插件压测")
+    parser.add_argument("--commands", default=DEFAULT_COMMANDS, help="逗号分隔的命令（不带 /），按顺序轮流执行")
+    parser.add_argument("--requests", type=int, default=400, help="命令总数，0 表示不压测命令")
+    parser.add_argument("--concurrency", type=int, default=20, help="同时执行的命令/通知数")
+    parser.add_argument("--groups", type=int, default=5, help="模拟的群数量")
+    parser.add_argument("--notify", type=int, default=0, help="通过 /xenforo/notify 提交的通知数")
+    parser.add_argument("--notify-timeout", type=float, default=30, help="等待通知全部送达的最长时间（秒）")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="模拟发送一条群消息的耗时（秒）")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟 XenForo 的平均响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01, help="响应延迟抖动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="XenForo 返回 500 的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="XenForo 返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=1, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--rate-limit", type=float, default=0, help="插件的 rate_limit 配置，0 表示不限速")
+    parser.add_argument("--prefetch", type=int, default=0, help="插件的 prefetch_interval 配置")
+    parser.add_argument("--persist", action="store_true", help="启用磁盘缓存（cache_persist）")
+    parser.add_argument("--no-cache", action="store_true", help="关闭响应缓存，测量未缓存时的上游压力")
+    parser.add_argument("--config", default="", help="额外的插件配置（JSON），覆盖上面的设置")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    outcome = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(outcome, ensure_ascii=False, indent=2, default=str))
+    else:
+        print_report(outcome)
@@ -1,11 +1,37 @@
 import asyncio
+import bisect
+import contextlib
+import contextvars
+import functools
+import hashlib
+import heapq
+import hmac
 import json
+import math
+import mmap
 import os
+import random
+import re
+import sqlite3
+import string
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import Optional
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
 from urllib.parse import urljoin
 
-import requests
+import aiohttp
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时用标准库 json
+    orjson = None
 
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent, filter
@@ -13,7 +39,58 @@ from astrbot.api.star import Context, Star, register
 from astrbot.api.provider import Provider
 
 
+# 熔断时返回旧数据，会在数据里带上这个键标记缓存时长（秒）
+STALE_KEY = "_xf_stale_age"
+
+# 当前上游请求由哪个命令触发（后台任务为 background），用于统计各命令带来的 API 负载
+REQUEST_SOURCE: contextvars.ContextVar = contextvars.ContextVar("xf_request_source", default="background")
+# 当前命令所在的群号，用于选择该群的回复模板
+REPLY_GROUP: contextvars.ContextVar = contextvars.ContextVar("xf_reply_group", default="")
+# 当前命令或后台任务所属的站点名（forums 配置中的 name），为空时使用默认站点
+CURRENT_FORUM: contextvars.ContextVar = contextvars.ContextVar("xf_current_forum", default="")
+
+# 默认缓存时间（秒）：板块和统计变化少，主题列表变化快；带 ID 的接口用 :id 表示
+DEFAULT_CACHE_TTL = {
+    "threads": 30,
+    "threads/:id/posts": 30,
+    "forums": 600,
+    "forums/:id": 600,
+    "index": 300,
+}
+
+# 回复模板：{字段} 会替换为数据，某行的字段全部为空时整行省略；可在配置 reply_templates 中按群覆盖
+DEFAULT_TEMPLATES = {
+    "thread_header": "📌 最新主题：\n\n",
+    "thread_item": "• {title}\n  作者: {username}\n  {url}\n\n",
+    "thread_detail": (
+        "📄 主题详情\n\n标题: {title}\n作者: {username}\n回复数: {reply_count}\n浏览数: {view_count}\n"
+        "发布时间: {post_date}\n\n{url}\n"
+    ),
+    "thread_breadcrumbs": "📂 {breadcrumbs}\n",
+    "thread_excerpt": "\n{excerpt}\n",
+    "thread_reply_header": "\n💬 最新回复：\n",
+    "thread_reply_item": "• {username}: {excerpt}\n",
+    "hot_header": "🔥 热门主题：\n\n",
+    "hot_item": "• {title}\n  作者: {username}\n  回复: {reply_count} | 浏览: {view_count}\n  {url}\n\n",
+    "post_header": "💬 最新回复：\n\n",
+    "post_item": "• 主题: {thread_title}\n  回复者: {username}\n  {url}\n\n",
+    "forum_header": "📁 板块列表：\n\n",
+    "forum_item": "• {title}\n  ID: {node_id}\n  主题数: {discussion_count}\n  {url}\n\n",
+    "forum_stats": (
+        "📊 论坛统计\n\n总主题数: {threads:,}\n总回复数: {messages:,}\n总用户数: {users:,}\n最新用户: {latest_member}\n"
+    ),
+    "user": (
+        "👤 用户信息\n\n用户名: {username}\n用户ID: {user_id}\n注册时间: {register_date}\n"
+        "帖子数: {message_count}\n反应分: {reaction_score}\n\n{profile_url}\n"
+    ),
+    "search_header": "🔍 搜索「{query}」找到 {count} 个主题\n\n",
+    "search_item": "• {title}\n  {url}\n",
+}
+
+
 class Config:
+    """解析后的配置快照，创建后只读；重新加载时整体替换"""
+
     def __init__(
         self,
         xf_url: str = "",
@@ -21,12 +98,2060 @@ class Config:
         threads_limit: int = 5,
         request_timeout: int = 10,
         require_slash: bool = True,
+        pool_size: int = 20,
+        pool_per_host: int = 10,
+        cache_ttl: Optional[dict] = None,
+        cache_stale_ttl: int = 300,
+        cache_max_entries: int = 256,
+        cache_persist: bool = True,
+        cache_persist_max_age: int = 86400,
+        cache_persist_max_entries: int = 5000,
+        cache_persist_compact_interval: int = 3600,
+        config_reload_interval: int = 5,
+        notify_workers: int = 4,
+        notify_queue_size: int = 1000,
+        notify_coalesce_window: float = 3,
+        notify_digest_max_items: int = 10,
+        notify_secret: str = "",
+        notify_dedupe_window: int = 600,
+        notify_dedupe_max_entries: int = 10000,
+        rate_limit: float = 10,
+        rate_burst: int = 20,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+        retry_max_delay: float = 10,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30,
+        prefetch_interval: int = 0,
+        prefetch_idle_timeout: int = 600,
+        watch_interval: int = 0,
+        watch_groups: Optional[list] = None,
+        watch_threads: bool = True,
+        watch_posts: bool = False,
+        watch_max_pages: int = 3,
+        hot_index_size: int = 500,
+        hot_seed_pages: int = 2,
+        hot_index_refresh: int = 300,
+        reply_chunk_size: int = 1500,
+        list_max_pages: int = 5,
+        list_prefetch: int = 2,
+        user_index_size: int = 5000,
+        user_index_ttl: int = 600,
+        user_preload_pages: int = 0,
+        search_results: int = 10,
+        search_compact_interval: int = 600,
+        search_compact_docs: int = 500,
+        reply_templates: Optional[dict] = None,
+        forums: Optional[list] = None,
+        command_user_limit: int = 5,
+        command_group_limit: int = 20,
+        command_window: int = 60,
+        send_rate: float = 5,
+        send_burst: int = 10,
+        send_group_interval: float = 1.0,
+        thread_detail_excerpt: int = 150,
+        thread_detail_replies: int = 3,
+        thread_detail_breadcrumbs: bool = True,
+        thread_detail_deadline: float = 0,
     ):
         self.xf_url = xf_url
         self.xf_api_key = xf_api_key
         self.threads_limit = threads_limit
         self.request_timeout = request_timeout
         self.require_slash = require_slash
+        self.pool_size = pool_size
+        self.pool_per_host = pool_per_host
+        # 各端点缓存秒数，键为 /api/ 之后的路径；未列出的端点不缓存
+        self.cache_ttl = dict(DEFAULT_CACHE_TTL if cache_ttl is None else cache_ttl)
+        self.cache_stale_ttl = cache_stale_ttl
+        self.cache_max_entries = cache_max_entries
+        self.cache_persist = cache_persist
+        self.cache_persist_max_age = cache_persist_max_age
+        self.cache_persist_max_entries = cache_persist_max_entries
+        self.cache_persist_compact_interval = cache_persist_compact_interval
+        self.config_reload_interval = config_reload_interval
+        self.notify_workers = notify_workers
+        self.notify_queue_size = notify_queue_size
+        self.notify_coalesce_window = notify_coalesce_window
+        self.notify_digest_max_items = notify_digest_max_items
+        # 通知接口的 HMAC-SHA256 密钥，为空时不校验签名
+        self.notify_secret = notify_secret
+        self.notify_dedupe_window = notify_dedupe_window
+        self.notify_dedupe_max_entries = notify_dedupe_max_entries
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_max_delay = retry_max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.prefetch_interval = prefetch_interval
+        self.prefetch_idle_timeout = prefetch_idle_timeout
+        self.watch_interval = watch_interval
+        self.watch_groups = tuple(watch_groups or ())
+        self.watch_threads = watch_threads
+        self.watch_posts = watch_posts
+        self.watch_max_pages = watch_max_pages
+        self.hot_index_size = hot_index_size
+        self.hot_seed_pages = hot_seed_pages
+        self.hot_index_refresh = hot_index_refresh
+        self.reply_chunk_size = reply_chunk_size
+        self.list_max_pages = list_max_pages
+        self.list_prefetch = list_prefetch
+        self.user_index_size = user_index_size
+        self.user_index_ttl = user_index_ttl
+        self.user_preload_pages = user_preload_pages
+        self.search_results = search_results
+        self.search_compact_interval = search_compact_interval
+        self.search_compact_docs = search_compact_docs
+        # 回复模板覆盖：{"default": {...}, "群号": {...}}
+        self.reply_templates = dict(reply_templates or {})
+        # 多站点：[{"name", "xf_url", "xf_api_key", "groups", ...}]，为空时使用顶层 xf_url / xf_api_key
+        self.forums = tuple(dict(entry) for entry in (forums or ()))
+        # 查询命令限流：每人 / 每群在 command_window 秒内最多触发的次数，0 表示不限
+        self.command_user_limit = command_user_limit
+        self.command_group_limit = command_group_limit
+        self.command_window = command_window
+        # 发送调度：全局每秒最多发送条数、突发条数、同一个群两条消息的最小间隔（秒）
+        self.send_rate = send_rate
+        self.send_burst = send_burst
+        self.send_group_interval = send_group_interval
+        # /主题 附加内容：首帖摘要字数、最新回复条数、板块路径，以及等待这些附加请求的最长时间（秒）
+        self.thread_detail_excerpt = thread_detail_excerpt
+        self.thread_detail_replies = thread_detail_replies
+        self.thread_detail_breadcrumbs = thread_detail_breadcrumbs
+        self.thread_detail_deadline = thread_detail_deadline
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"Config 为只读快照，不能修改 {name}")
+        super().__setattr__(name, value)
+
+
+def _json_default(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def json_loads(body):
+    """解析接口返回的 JSON；安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def json_dumps(data) -> str:
+    """序列化为 JSON 文本，Record 按字典写出"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+_MISSING = object()
+
+
+class Record:
+    """接口记录的精简形式：只保留 FIELDS 中的字段，存在 __slots__ 里
+
+    读取方式与 dict 相同（get / [] / in / keys），模板、索引和缓存不用区分两者；
+    NESTED 中的嵌套对象同样转成对应的记录类型，其余字段原样保留。
+    """
+
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+    NESTED: Dict[str, type] = {}
+
+    @classmethod
+    def from_dict(cls, data, fields: Optional[Tuple[str, ...]] = None) -> "Record":
+        """从 dict（或另一个记录）提取字段；fields 为 FIELDS 的子集时只保留这些字段"""
+        record = cls.__new__(cls)
+        for field in fields or cls.FIELDS:
+            value = data.get(field, _MISSING)
+            if value is _MISSING:
+                continue
+            nested = cls.NESTED.get(field)
+            if nested is not None and isinstance(value, dict):
+                value = nested.from_dict(value)
+            setattr(record, field, value)
+        return record
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> List[str]:
+        return [field for field in self.FIELDS if hasattr(self, field)]
+
+    def to_dict(self) -> dict:
+        result = {}
+        for field in self.keys():
+            value = getattr(self, field)
+            result[field] = value.to_dict() if isinstance(value, Record) else value
+        return result
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class ThreadRecord(Record):
+    FIELDS = (
+        "thread_id", "node_id", "title", "username", "reply_count", "view_count", "first_post_reaction_score",
+        "post_date", "last_post_date", "discussion_state", "Forum", "FirstPost",
+    )
+    __slots__ = FIELDS
+
+
+class PostRecord(Record):
+    FIELDS = (
+        "post_id", "thread_id", "username", "position", "is_first_post", "message", "post_date", "last_edit_date",
+        "Thread",
+    )
+    __slots__ = FIELDS
+
+
+class UserRecord(Record):
+    FIELDS = ("user_id", "username", "register_date", "message_count", "reaction_score", "view_url", "Profile")
+    __slots__ = FIELDS
+
+
+class ForumRecord(Record):
+    FIELDS = ("node_id", "title", "discussion_count", "breadcrumbs")
+    __slots__ = FIELDS
+
+
+ThreadRecord.NESTED = {"Forum": ForumRecord, "FirstPost": PostRecord}
+PostRecord.NESTED = {"Thread": ThreadRecord}
+
+# isinstance 检查接口记录时用：原始 dict 或精简后的 Record
+RECORD_TYPES = (dict, Record)
+
+# 响应中的键 -> 记录类型；其余键（pagination、statistics 等）原样保留
+PAYLOAD_RECORDS = {
+    "threads": ThreadRecord,
+    "thread": ThreadRecord,
+    "posts": PostRecord,
+    "post": PostRecord,
+    "forums": ForumRecord,
+    "forum": ForumRecord,
+    "users": UserRecord,
+    "exact": UserRecord,
+    "recommendations": UserRecord,
+}
+
+
+def project_payload(data):
+    """把接口响应中的主题、帖子、用户、板块转成精简记录，丢掉用不到的字段"""
+    if not isinstance(data, dict):
+        return data
+    for key, record_type in PAYLOAD_RECORDS.items():
+        value = data.get(key)
+        if isinstance(value, dict):
+            data[key] = record_type.from_dict(value)
+        elif isinstance(value, list):
+            data[key] = [record_type.from_dict(item) if isinstance(item, dict) else item for item in value]
+    return data
+
+
+class ResponseCache:
+    """按 LRU 淘汰的响应缓存，记录写入时间供调用方判断新鲜度"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """返回 (数据, 已缓存秒数)，未命中返回 None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        stored_at, value = entry
+        return value, time.monotonic() - stored_at
+
+    def set(self, key: Hashable, value: Any, age: float = 0.0) -> None:
+        """age：数据在写入前已经存在的秒数（从磁盘缓存恢复时使用）"""
+        self._entries[key] = (time.monotonic() - age, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def resize(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class PersistentCache:
+    """磁盘缓存（SQLite）：保存接口响应和抓取时间，重启后不用从冷缓存开始
+
+    连接在第一次用到时才打开，所有磁盘操作都应放到线程里执行（asyncio.to_thread）；
+    写入先进入内存缓冲，由后台在事件循环中取出（take）后到线程里批量落盘（flush）。
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS responses ("
+        " site TEXT NOT NULL, key TEXT NOT NULL, fetched_at REAL NOT NULL, body TEXT NOT NULL,"
+        " PRIMARY KEY (site, key))"
+    )
+
+    def __init__(self, path: str, max_age: float = 86400, max_entries: int = 5000):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # 待写入：(站点, 键) -> (抓取时间, JSON)，同一个键只保留最新一次
+        self._pending: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self.loaded = 0
+        self.written = 0
+
+    @staticmethod
+    def encode_key(key: tuple) -> str:
+        return json.dumps(key, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def put(self, site: str, key: tuple, data: Any, fetched_at: Optional[float] = None) -> None:
+        """记下待写入的响应（在事件循环中调用，不碰磁盘）"""
+        self._pending[(site, self.encode_key(key))] = (
+            time.time() if fetched_at is None else fetched_at,
+            json_dumps(data),
+        )
+
+    def get(self, site: str, key: tuple) -> Optional[Tuple[Any, float]]:
+        """读取 (数据, 已缓存秒数)；未写盘的缓冲优先（在线程中调用）"""
+        encoded = self.encode_key(key)
+        entry = self._pending.get((site, encoded))
+        if entry is None:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT fetched_at, body FROM responses WHERE site = ? AND key = ?", (site, encoded)
+                ).fetchone()
+            if row is None:
+                return None
+            entry = row
+        fetched_at, body = entry
+        age = max(0.0, time.time() - fetched_at)
+        if age > self.max_age:
+            return None
+        self.loaded += 1
+        return project_payload(json_loads(body)), age
+
+    def take(self) -> list:
+        """取出缓冲中待写入的行（在事件循环中调用，与 put() 在同一个线程里换缓冲）"""
+        pending, self._pending = self._pending, {}
+        return [(site, key, fetched_at, body) for (site, key), (fetched_at, body) in pending.items()]
+
+    def flush(self, rows: list) -> int:
+        """把 take() 取出的行批量写入磁盘，一个事务完成（在线程中调用）"""
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO responses (site, key, fetched_at, body) VALUES (?, ?, ?, ?)", rows
+                )
+        self.written += len(rows)
+        return len(rows)
+
+    def compact(self, sites: Tuple[str, ...]) -> int:
+        """删除已不在配置中的站点、超过 max_age 以及超出 max_entries 的旧记录，删得多时回收文件空间"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN")
+                placeholders = ",".join("?" * len(sites))
+                removed = conn.execute(
+                    f"DELETE FROM responses WHERE site NOT IN ({placeholders}) OR fetched_at < ?",
+                    (*sites, time.time() - self.max_age),
+                ).rowcount
+                removed += conn.execute(
+                    "DELETE FROM responses WHERE rowid IN ("
+                    " SELECT rowid FROM responses ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                    (max(1, self.max_entries),),
+                ).rowcount
+                total = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if removed and removed >= total:
+                conn.execute("VACUUM")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class SingleFlight:
+    """合并并发的相同调用：同一个键同一时刻只执行一次，结果分发给所有等待者"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            # 独立成任务执行，发起者被取消时其他等待者仍能拿到结果
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._done(key, f))
+        return await asyncio.shield(fut)
+
+    def _done(self, key: Hashable, fut: asyncio.Future) -> None:
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+        if not fut.cancelled():
+            fut.exception()  # 标记异常已读取，避免无人等待时告警
+
+
+class Metrics:
+    """进程内指标：带标签的计数器和直方图，导出为 Prometheus 文本格式"""
+
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    ID_RE = re.compile(r"/\d+(?=/|$)")
+
+    def __init__(self, prefix: str = "xenforo"):
+        self.prefix = prefix
+        self._help: Dict[str, str] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        # 直方图：标签 -> [各桶计数..., +Inf 计数, 总和]
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+
+    @classmethod
+    def endpoint(cls, path: str) -> str:
+        """/api/threads/123 -> /api/threads/:id，避免标签基数随 ID 增长"""
+        return cls.ID_RE.sub("/:id", path)
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        buckets = series.get(key)
+        if buckets is None:
+            buckets = series[key] = [0] * (len(self.LATENCY_BUCKETS) + 1) + [0.0]
+        buckets[bisect.bisect_left(self.LATENCY_BUCKETS, value)] += 1
+        buckets[-1] += value
+
+    def series(self, name: str) -> Dict[tuple, float]:
+        """计数器的全部标签组合及其值"""
+        return dict(self._counters.get(name, {}))
+
+    def counter(self, name: str, **labels) -> float:
+        """按给定标签汇总计数（未给出的标签全部相加）"""
+        wanted = set(labels.items())
+        return sum(v for key, v in self._counters.get(name, {}).items() if wanted <= set(key))
+
+    def histogram(self, name: str) -> Dict[tuple, Tuple[int, float]]:
+        """各标签组合的 (次数, 总和)"""
+        return {key: (sum(b[:-1]), b[-1]) for key, b in self._histograms.get(name, {}).items()}
+
+    def quantile(self, name: str, q: float, **labels) -> Optional[float]:
+        """由分桶估算分位数（取所在桶的上界），没有数据时返回 None"""
+        wanted = set(labels.items())
+        merged = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        for key, buckets in self._histograms.get(name, {}).items():
+            if wanted <= set(key):
+                merged = [a + b for a, b in zip(merged, buckets)]
+        total = sum(merged)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(merged):
+            seen += count
+            if seen >= rank:
+                return self.LATENCY_BUCKETS[index] if index < len(self.LATENCY_BUCKETS) else math.inf
+        return math.inf
+
+    @staticmethod
+    def _labels(key: tuple, extra: str = "") -> str:
+        parts = []
+        for k, v in key:
+            v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            parts.append(f'{k}="{v}"')
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """gauges: 名称 -> (说明, 当前值)，由调用方在导出时采集"""
+        lines = []
+        for name, series in self._counters.items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {full} counter")
+            for key, value in series.items():
+                lines.append(f"{full}{self._labels(key)} {value:g}")
+        for name, series in self._histograms.items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {full} histogram")
+            for key, buckets in series.items():
+                cumulative = 0
+                for bound, count in zip(self.LATENCY_BUCKETS + ("+Inf",), buckets):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{full}_bucket{self._labels(key, le)} {cumulative}")
+                lines.append(f"{full}_sum{self._labels(key)} {buckets[-1]:.6f}")
+                lines.append(f"{full}_count{self._labels(key)} {cumulative}")
+        for name, (help_text, value) in (gauges or {}).items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+class SendScheduler:
+    """群消息发送调度：全局每秒条数上限 + 每个群的最小发送间隔，命令回复优先于通知
+
+    发送前调用 acquire(群号, 通道) 排队，返回后立即发送。等待者不多（命令回复加上通知 worker 数），
+    每次放行时线性扫描选出：通道优先级最高、先到、且所在群已过间隔的一个。
+    """
+
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+    LANES = (INTERACTIVE, BULK)
+
+    def __init__(self, rate: float = 5, burst: int = 10, group_interval: float = 1.0, metrics: Optional[Metrics] = None):
+        self.rate = rate
+        self.burst = burst
+        self.group_interval = group_interval
+        self.metrics = metrics or Metrics()
+        self.max_groups = 5000
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        # 群号 -> 下一次允许发送的时间
+        self._next_at: Dict[str, float] = {}
+        # [通道序号, 到达序号, 群号, 入队时间, future]
+        self._waiting: List[list] = []
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self.granted = {lane: 0 for lane in self.LANES}
+        self.max_depth = 0
+
+    def configure(self, rate: float, burst: int, group_interval: float) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.group_interval = max(0.0, group_interval)
+        self._tokens = min(self._tokens, float(self.burst))
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 or self.group_interval > 0
+
+    def depth(self, lane: Optional[str] = None) -> int:
+        if lane is None:
+            return len(self._waiting)
+        rank = self.LANES.index(lane)
+        return sum(1 for entry in self._waiting if entry[0] == rank)
+
+    async def acquire(self, group_id: str, lane: str = BULK) -> None:
+        if not self.enabled:
+            self.granted[lane] += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        entry = [self.LANES.index(lane), self._seq, group_id, time.monotonic(), future]
+        self._waiting.append(entry)
+        self.max_depth = max(self.max_depth, len(self._waiting))
+        self._kick()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._waiting:
+                self._waiting.remove(entry)
+            raise
+
+    def _kick(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def _pump(self) -> None:
+        while self._waiting:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._refill(now)
+            token_wait = 0.0 if self.rate <= 0 or self._tokens >= 1 else (1 - self._tokens) / self.rate
+            best = None
+            group_wait = math.inf
+            for entry in self._waiting:
+                ready_at = self._next_at.get(entry[2], 0.0)
+                if ready_at > now:
+                    group_wait = min(group_wait, ready_at - now)
+                elif best is None or entry[:2] < best[:2]:
+                    best = entry
+
+            if best is not None and not token_wait:
+                self._grant(best, now)
+                continue
+            delay = token_wait if best is not None else group_wait
+            # 新的等待者可能属于空闲的群，被唤醒后重新挑选
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.001, delay))
+
+    def _grant(self, entry: list, now: float) -> None:
+        self._waiting.remove(entry)
+        rank, _, group_id, queued_at, future = entry
+        if future.done():
+            return
+        if self.rate > 0:
+            self._tokens -= 1
+        if self.group_interval > 0:
+            if len(self._next_at) >= self.max_groups:
+                self._next_at = {g: t for g, t in self._next_at.items() if t > now}
+            self._next_at[group_id] = now + self.group_interval
+        lane = self.LANES[rank]
+        self.granted[lane] += 1
+        self.metrics.observe("send_wait_seconds", now - queued_at, lane=lane)
+        future.set_result(None)
+
+    def close(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+
+    def stats(self) -> dict:
+        return {
+            "depth": {lane: self.depth(lane) for lane in self.LANES},
+            "max_depth": self.max_depth,
+            "granted": dict(self.granted),
+        }
+
+
+class NotificationQueue:
+    """通知投递队列：按群号分片给固定的 worker，保证同一个群内消息有序
+
+    maxsize 是所有分片合计的容量，单个群再忙也能用满整个队列。
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, str], Awaitable[Any]],
+        workers: int = 4,
+        maxsize: int = 1000,
+        metrics: Optional[Metrics] = None,
+    ):
+        self._send = send
+        self.metrics = metrics or Metrics()
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self._shards = [asyncio.Queue() for _ in range(self.workers)]
+        # 所有分片中等待发送的条数，以及为合并中的通知预留的位置，两者合计不超过 maxsize
+        self._queued = 0
+        self._reserved = 0
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.send_seconds = 0.0
+
+    def depth(self) -> int:
+        return self._queued
+
+    def is_full(self) -> bool:
+        return self._queued + self._reserved >= self.maxsize
+
+    def reserve(self, count: int) -> bool:
+        """预留 count 个位置，之后用 put(reserved=True) 入队一定成功；放不下时一个都不预留"""
+        if count and self._queued + self._reserved + count > self.maxsize:
+            self.rejected += count
+            return False
+        self._reserved += count
+        return True
+
+    def release(self, count: int) -> None:
+        self._reserved = max(0, self._reserved - count)
+
+    def put(self, group_id: str, message: str, event_type: str = "", reserved: bool = False) -> bool:
+        """非阻塞入队；队列已满时返回 False，由调用方回报背压。reserved=True 时使用 reserve() 预留的位置"""
+        if reserved:
+            self.release(1)
+        elif self.is_full():
+            self.rejected += 1
+            return False
+        shard = self._shards[hash(group_id) % self.workers]
+        shard.put_nowait((group_id, message, event_type, time.monotonic()))
+        self._queued += 1
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth())
+        return True
+
+    async def run_worker(self, index: int) -> None:
+        queue = self._shards[index]
+        while True:
+            group_id, message, event_type, queued_at = await queue.get()
+            self._queued -= 1
+            started = time.monotonic()
+            self.metrics.observe("notify_wait_seconds", started - queued_at)
+            try:
+                await self._send(group_id, message)
+                self.sent += 1
+                logger.info(
+                    f"[XenForo] 通知已发送到群 {group_id}（{event_type or '未知事件'}，"
+                    f"排队 {started - queued_at:.2f}s）"
+                )
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"[XenForo] 发送消息到群 {group_id} 失败: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                self.send_seconds += elapsed
+                self.metrics.observe("notify_send_seconds", elapsed)
+                queue.task_done()
+
+    def stats(self) -> dict:
+        done = self.sent + self.failed
+        return {
+            "depth": self.depth(),
+            "reserved": self._reserved,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_send_ms": round(self.send_seconds * 1000 / done, 1) if done else 0,
+        }
+
+
+class NotificationCoalescer:
+    """批量通知合并：同一个群在窗口期内的多条通知汇总成一条消息再入队
+
+    某个群开始合并时就在队列里为它预留一个位置，窗口结束时汇总消息一定能入队，接收时答应的通知不会丢。
+    """
+
+    EVENT_LABELS = (("thread", "主题"), ("post", "回复"), ("resource", "资源"), ("user", "用户"))
+
+    def __init__(
+        self,
+        queue: NotificationQueue,
+        window: float = 3,
+        max_items: int = 10,
+        on_queued: Optional[Callable[[list], None]] = None,
+    ):
+        self._queue = queue
+        self.window = window
+        self.max_items = max_items
+        # 合并后的消息入队成功时，用其中各条通知的去重键回调
+        self.on_queued = on_queued
+        self._pending: Dict[str, list] = {}
+        self._keys: set = set()
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self.merged = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        """去重键对应的通知是否还在窗口期内等待合并"""
+        return key in self._keys
+
+    def add(
+        self, group_id: str, message: str, event_type: str = "", node_title: str = "", key: Optional[Hashable] = None
+    ) -> bool:
+        return self.add_many([(group_id, message, event_type, node_title, key)])
+
+    def add_many(self, events: list) -> bool:
+        """events: [(群号, 消息, 事件类型, 板块名, 去重键)]；队列放不下新出现的群时全部拒绝，返回 False"""
+        new_groups = {event[0] for event in events if event[0] not in self._pending}
+        if not self._queue.reserve(len(new_groups)):
+            return False
+        loop = asyncio.get_running_loop()
+        for group_id, message, event_type, node_title, key in events:
+            self._pending.setdefault(group_id, []).append((message, event_type, node_title, key))
+            if key is not None:
+                self._keys.add(key)
+            if group_id not in self._timers:
+                self._timers[group_id] = loop.call_later(self.window, self._flush, group_id)
+        return True
+
+    def _flush(self, group_id: str) -> None:
+        self._timers.pop(group_id, None)
+        events = self._pending.pop(group_id, [])
+        if not events:
+            return
+        keys = [key for *_, key in events if key is not None]
+        self._keys.difference_update(keys)
+        if len(events) == 1:
+            message, event_type, _, _ = events[0]
+        else:
+            message, event_type = self._digest(events), "digest"
+            self.merged += len(events) - 1
+        self._queue.put(group_id, message, event_type, reserved=True)
+        if keys and self.on_queued is not None:
+            self.on_queued(keys)
+
+    def _label(self, event_type: str) -> str:
+        event_type = (event_type or "").lower()
+        for key, label in self.EVENT_LABELS:
+            if key in event_type:
+                return label
+        return "通知"
+
+    def _digest(self, events: list) -> str:
+        counts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        for _, event_type, node_title, _ in events:
+            key = (node_title, self._label(event_type))
+            counts[key] = counts.get(key, 0) + 1
+
+        lines = [f"📢 论坛动态汇总（共 {len(events)} 条）", ""]
+        for (node_title, label), count in counts.items():
+            scope = f"板块「{node_title}」" if node_title else "论坛"
+            lines.append(f"• {scope}新增 {count} 条{label}")
+        lines.append("")
+        for index, (message, *_) in enumerate(events[: self.max_items], 1):
+            first_line = str(message).strip().splitlines()[0] if str(message).strip() else ""
+            if len(first_line) > 60:
+                first_line = first_line[:60] + "…"
+            lines.append(f"{index}. {first_line}")
+        if len(events) > self.max_items:
+            lines.append(f"…… 还有 {len(events) - self.max_items} 条未显示")
+        return "\n".join(lines)
+
+    def cancel(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._queue.release(len(self._pending))
+        self._pending.clear()
+        self._keys.clear()
+
+
+class RateLimiter:
+    """自适应令牌桶：收到 429 时速率减半并暂停到 Retry-After，请求成功后逐步恢复"""
+
+    def __init__(self, rate: float = 10, burst: int = 20, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def configure(self, rate: float, burst: int) -> None:
+        if rate != self.max_rate:
+            self.max_rate = rate
+            self.rate = min(self.rate, rate) if self.rate > 0 and rate > 0 else rate
+        self.burst = max(1, burst)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rate > 0
+
+    async def acquire(self) -> None:
+        if not self.enabled:
+            return
+        # 持锁排队，先到先得
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_success(self) -> None:
+        if self.enabled and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def on_server_error(self) -> None:
+        if self.enabled:
+            self.rate = max(self.min_rate, self.rate * 0.8)
+
+
+class SlidingWindowLimiter:
+    """按键的滑动窗口计数：用当前和上一个固定窗口的计数按时间加权估算最近 window 秒的次数
+
+    每个键只保存 [当前窗口起点, 上一窗口计数, 当前窗口计数]；两个窗口内没有访问的键自动过期，
+    键数超过 max_keys 时淘汰最久未访问的键，内存不随群和用户数量增长。
+    """
+
+    def __init__(self, window: float = 60, max_keys: int = 10000):
+        self.window = window
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def configure(self, window: float) -> None:
+        window = max(1.0, window)
+        if window != self.window:
+            self.window = window
+            self._counters.clear()
+
+    def _entry(self, key: Hashable, now: float) -> list:
+        start = now - now % self.window
+        entry = self._counters.get(key)
+        if entry is None:
+            entry = self._counters[key] = [start, 0, 0]
+        else:
+            self._counters.move_to_end(key)
+            if entry[0] != start:
+                # 只跨过一个窗口时当前计数变为上一窗口计数，跨过更多则都清零
+                entry[1] = entry[2] if start - entry[0] == self.window else 0
+                entry[0], entry[2] = start, 0
+        return entry
+
+    def _expire(self, now: float) -> None:
+        counters = self._counters
+        while counters:
+            entry = next(iter(counters.values()))
+            if entry[0] + 2 * self.window > now and len(counters) <= self.max_keys:
+                break
+            counters.popitem(last=False)
+
+    def _wait(self, entry: list, limit: int, now: float) -> float:
+        """还要等多少秒估算值才会低于 limit；0 表示现在就可以"""
+        start, previous, current = entry
+        elapsed = now - start
+        if previous * (1 - elapsed / self.window) + current < limit:
+            return 0.0
+        if current < limit:
+            # 本窗口内等上一窗口的权重降下来
+            return max(0.001, self.window * (1 - (limit - current) / previous) - elapsed)
+        # 要等到下一个窗口，本窗口的计数降为上一窗口后再按权重衰减
+        return self.window - elapsed + self.window * (1 - limit / current)
+
+    def acquire(self, limits: List[Tuple[Hashable, int]], now: Optional[float] = None) -> float:
+        """limits: [(键, 窗口内上限)]，上限 <= 0 的项不限制
+
+        全部未超限时每个键计数一次并返回 0；否则不计数，返回最长需要等待的秒数。
+        """
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        checks = [(self._entry(key, now), limit) for key, limit in limits if limit > 0]
+        wait = max((self._wait(entry, limit, now) for entry, limit in checks), default=0.0)
+        if wait:
+            return wait
+        for entry, _ in checks:
+            entry[2] += 1
+        return 0.0
+
+
+class ReplyChunker:
+    """把逐条生成的回复内容按长度切分成多条消息，单条内容不会被拆开"""
+
+    def __init__(self, max_chars: int = 1500):
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._size = 0
+
+    def add(self, text: str) -> Optional[str]:
+        """追加内容；累计长度达到上限时返回一条完整消息"""
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.max_chars:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return text
+
+
+@functools.lru_cache(maxsize=4096)
+def format_timestamp(timestamp: int) -> str:
+    """Unix 时间戳转可读时间；列表里同一时间戳反复出现，结果缓存起来"""
+    return datetime.fromtimestamp(timestamp).strftime("%Y年%m月%d日 %H:%M:%S")
+
+
+class ReplyTemplate:
+    """编译后的回复模板：按行拆成字面量和字段，渲染时拼成列表一次 join"""
+
+    _formatter = string.Formatter()
+
+    def __init__(self, source: str):
+        self.source = source
+        # 每行：(片段元组, 是否含字段)；片段为 (字面量, 字段名或 None, 格式说明)
+        self._lines: List[Tuple[tuple, bool]] = []
+        for line in source.splitlines(keepends=True):
+            segments = []
+            for literal, field, spec, _ in self._formatter.parse(line):
+                if literal:
+                    segments.append((literal, None, ""))
+                if field is not None:
+                    segments.append(("", field, spec or ""))
+            self._lines.append((tuple(segments), any(field is not None for _, field, _ in segments)))
+        # 不含字段的模板（如列表标题）直接返回原文
+        self._static = None if any(has_fields for _, has_fields in self._lines) else self._formatter.vformat(source, (), {})
+
+    def render(self, values: dict) -> str:
+        if self._static is not None:
+            return self._static
+        parts = []
+        for segments, has_fields in self._lines:
+            line = []
+            filled = not has_fields
+            for literal, field, spec in segments:
+                if field is None:
+                    line.append(literal)
+                    continue
+                value = values.get(field)
+                if value is None or value == "":
+                    continue
+                filled = True
+                line.append(format(value, spec) if spec else str(value))
+            if filled:
+                parts.extend(line)
+        return "".join(parts)
+
+
+class ReplyTemplates:
+    """回复模板集合：默认模板 + 按群覆盖，配置加载时编译一次
+
+    列表条目渲染结果按 (模板集, 模板名, 记录 ID 与修改时间) 缓存，数据没变的条目不会重复渲染。
+    """
+
+    def __init__(self, max_fragments: int = 2048):
+        self.max_fragments = max_fragments
+        self._sets: Dict[str, Dict[str, ReplyTemplate]] = {}
+        self._fragments: "OrderedDict[tuple, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.configure({})
+
+    def configure(self, overrides: dict) -> None:
+        """overrides: {"default": {模板名: 模板}, "群号": {模板名: 模板}}；未知模板名会被忽略"""
+        builtin = {name: ReplyTemplate(source) for name, source in DEFAULT_TEMPLATES.items()}
+        default = self._compile("default", overrides.get("default"), builtin)
+        self._sets = {"default": default}
+        for group_id, templates in overrides.items():
+            if group_id == "default" or not isinstance(templates, dict):
+                continue
+            self._sets[str(group_id)] = self._compile(str(group_id), templates, default)
+        self._fragments.clear()
+
+    @classmethod
+    def _compile(cls, set_name: str, templates, base: Dict[str, ReplyTemplate]) -> Dict[str, ReplyTemplate]:
+        """在 base 之上编译覆盖的模板；格式有误的模板记日志后沿用 base 中的同名模板"""
+        compiled = dict(base)
+        for name, source in cls._known(templates).items():
+            try:
+                compiled[name] = ReplyTemplate(source)
+            except ValueError as e:
+                logger.warning(f"[XenForo] 回复模板 {set_name}.{name} 格式有误，已改用默认模板: {e}")
+        return compiled
+
+    @staticmethod
+    def _known(templates) -> dict:
+        if not isinstance(templates, dict):
+            return {}
+        return {name: str(source) for name, source in templates.items() if name in DEFAULT_TEMPLATES}
+
+    def customized(self, group_id: str) -> bool:
+        return bool(group_id) and group_id in self._sets
+
+    def render(self, name: str, values: dict, group_id: str = "") -> str:
+        templates = self._sets.get(group_id) or self._sets["default"]
+        return templates[name].render(values)
+
+    def render_item(
+        self, name: str, key: Optional[tuple], values: Callable[[dict], dict], record: dict, group_id: str = ""
+    ) -> str:
+        """渲染一条记录；key 为 None（缺少 ID）时不缓存"""
+        set_name = group_id if group_id in self._sets else "default"
+        if key is not None:
+            memo_key = (set_name, name, key)
+            text = self._fragments.get(memo_key)
+            if text is not None:
+                self._fragments.move_to_end(memo_key)
+                self.hits += 1
+                return text
+        self.misses += 1
+        text = self._sets[set_name][name].render(values(record))
+        if key is not None:
+            self._fragments[memo_key] = text
+            while len(self._fragments) > self.max_fragments:
+                self._fragments.popitem(last=False)
+        return text
+
+    def clear(self) -> None:
+        self._fragments.clear()
+
+
+class UserIndex:
+    """用户名索引：LRU 限制条数，有序名单做前缀匹配，字符二元组做近似匹配"""
+
+    FIELDS = ("user_id", "username", "register_date", "message_count", "reaction_score", "view_url")
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        # 键 -> (写入时间, 记录, 是否为完整资料)
+        self._users: "OrderedDict[str, Tuple[float, UserRecord, bool]]" = OrderedDict()
+        self._names: List[str] = []
+        self._grams: Dict[str, set] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return (name or "").strip().casefold()
+
+    @staticmethod
+    def _bigrams(key: str) -> set:
+        padded = f" {key} "
+        return {padded[i : i + 2] for i in range(len(padded) - 1)}
+
+    def add(self, user: dict, complete: bool = True) -> None:
+        """写入用户；complete=False 表示只有用户名等简要信息（如搜索推荐），只用于联想"""
+        if not isinstance(user, RECORD_TYPES) or not user.get("username"):
+            return
+        key = self._key(user["username"])
+        record = UserRecord.from_dict(user, self.FIELDS)
+        if key in self._users:
+            self._users.move_to_end(key)
+            if not complete and self._users[key][2]:
+                return
+        else:
+            bisect.insort(self._names, key)
+            for gram in self._bigrams(key):
+                self._grams.setdefault(gram, set()).add(key)
+        self._users[key] = (time.monotonic(), record, complete)
+        while len(self._users) > self.max_size:
+            self._remove(next(iter(self._users)))
+
+    def _remove(self, key: str) -> None:
+        self._users.pop(key, None)
+        index = bisect.bisect_left(self._names, key)
+        if index < len(self._names) and self._names[index] == key:
+            del self._names[index]
+        for gram in self._bigrams(key):
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+
+    def get(self, name: str, max_age: float) -> Optional[UserRecord]:
+        """精确查找（忽略大小写），超过 max_age 秒的记录视为过期"""
+        entry = self._users.get(self._key(name))
+        if entry is None or not entry[2] or time.monotonic() - entry[0] > max_age:
+            return None
+        self._users.move_to_end(self._key(name))
+        return entry[1]
+
+    def suggest(self, name: str, limit: int = 5) -> List[str]:
+        """相近用户名：先取前缀匹配，不足时按二元组相似度补齐"""
+        key = self._key(name)
+        if not key:
+            return []
+        results: List[str] = []
+        start = bisect.bisect_left(self._names, key)
+        for candidate in self._names[start : start + limit]:
+            if not candidate.startswith(key):
+                break
+            results.append(candidate)
+
+        if len(results) < limit:
+            grams = self._bigrams(key)
+            scores: Dict[str, int] = {}
+            for gram in grams:
+                for candidate in self._grams.get(gram, ()):
+                    scores[candidate] = scores.get(candidate, 0) + 1
+            ranked = sorted(
+                scores.items(),
+                key=lambda item: 2 * item[1] / (len(grams) + len(self._bigrams(item[0]))),
+                reverse=True,
+            )
+            for candidate, shared in ranked:
+                if len(results) >= limit:
+                    break
+                similarity = 2 * shared / (len(grams) + len(self._bigrams(candidate)))
+                if similarity >= 0.4 and candidate not in results:
+                    results.append(candidate)
+
+        return [self._users[candidate][1]["username"] for candidate in results if candidate in self._users]
+
+    def clear(self) -> None:
+        self._users.clear()
+        self._names = []
+        self._grams.clear()
+
+
+class HotThreadIndex:
+    """本地热门主题索引
+
+    由各处拿到的主题列表增量更新，热度分 = 互动量 / (距最后活跃小时数 + 2) ^ gravity，
+    互动量综合回复数、浏览数和首帖反应分。排名结果缓存一段时间，取前 K 条为 O(K)。
+    """
+
+    FIELDS = (
+        "thread_id", "node_id", "title", "username", "reply_count", "view_count", "first_post_reaction_score",
+        "post_date", "last_post_date",
+    )
+    RANK_SIZE = 50
+    RANK_TTL = 60
+
+    def __init__(self, max_size: int = 500, gravity: float = 1.5):
+        self.max_size = max_size
+        self.gravity = gravity
+        self.updated_at = 0.0
+        self._threads: Dict[int, ThreadRecord] = {}
+        self._ranked: list = []
+        self._ranked_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def update(self, threads: list) -> None:
+        for t in threads:
+            if not isinstance(t, RECORD_TYPES):
+                continue
+            try:
+                thread_id = int(t.get("thread_id") or 0)
+            except (TypeError, ValueError):
+                continue
+            if not thread_id or t.get("discussion_state", "visible") != "visible":
+                continue
+            record = ThreadRecord.from_dict(t, self.FIELDS)
+            record.thread_id = thread_id
+            self._threads[thread_id] = record
+        if len(self._threads) > self.max_size:
+            now = time.time()
+            keep = heapq.nlargest(self.max_size, self._threads.values(), key=lambda r: self.score(r, now))
+            self._threads = {r["thread_id"]: r for r in keep}
+        self.updated_at = time.monotonic()
+        self._ranked_at = 0.0
+
+    def score(self, record: ThreadRecord, now: Optional[float] = None) -> float:
+        now = now or time.time()
+        active_at = record.get("last_post_date") or record.get("post_date") or now
+        age_hours = max(0.0, (now - float(active_at)) / 3600)
+        engagement = (
+            int(record.get("reply_count") or 0) * 3
+            + int(record.get("view_count") or 0) * 0.05
+            + int(record.get("first_post_reaction_score") or 0) * 2
+            + 1
+        )
+        return engagement / ((age_hours + 2) ** self.gravity)
+
+    def top(self, k: int) -> list:
+        stale = time.monotonic() - self._ranked_at > self.RANK_TTL
+        if stale or (k > len(self._ranked) and len(self._ranked) < len(self._threads)):
+            now = time.time()
+            size = max(k, self.RANK_SIZE)
+            self._ranked = heapq.nlargest(size, self._threads.values(), key=lambda r: self.score(r, now))
+            self._ranked_at = time.monotonic()
+        return self._ranked[:k]
+
+    def get(self, thread_id: int) -> Optional[ThreadRecord]:
+        return self._threads.get(thread_id)
+
+    def is_fresh(self, max_age: float) -> bool:
+        return self.updated_at > 0 and time.monotonic() - self.updated_at < max_age
+
+    def clear(self) -> None:
+        self._threads.clear()
+        self._ranked = []
+        self._ranked_at = 0.0
+        self.updated_at = 0.0
+
+
+class ThreadSearchIndex:
+    """主题全文索引（标题 + 首帖），中文按单字和二元组切词
+
+    新内容先写入内存增量索引；后台定期与磁盘上的基础段合并成紧凑的二进制文件，
+    启动时以 mmap 映射，查询时在词表上二分查找，不需要把整个索引读进内存。
+
+    文件格式（小端）：文件头 | 站点地址 | 词表 | 文档表 | 倒排表(u32) | 字符串区
+    """
+
+    MAGIC = b"XFSI"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHIIII")  # magic, version, 保留, 词数, 文档数, 倒排条数, 站点地址长度
+    TERM = struct.Struct("<IIII")  # 词偏移, 词长度, 倒排起始下标, 倒排条数
+    DOC = struct.Struct("<IIIII")  # thread_id, 标题偏移, 标题长度, 标题 CRC, 全文 CRC（无首帖为 0）
+    TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9a-z]+")
+    BBCODE_RE = re.compile(r"\[/?[^\[\]]{1,40}\]")
+    MAX_TEXT = 2000
+
+    def __init__(self, path: str, site: str = ""):
+        self.path = path
+        self.site = site
+        # 增量文档：thread_id -> (标题, 标题 CRC, 全文 CRC, 词集合, 是否沿用基础段中的词)
+        self._delta: Dict[int, Tuple[str, int, int, frozenset, bool]] = {}
+        self._postings: Dict[str, set] = {}
+        self._mm: Optional[mmap.mmap] = None
+        self._file = None
+        self._n_terms = self._n_docs = 0
+        self._terms_at = self._docs_at = self._postings_at = self._blob_at = 0
+        # 合并线程正在读基础段（snapshot() 到 finish_compact() 之间），此时不能关闭或重新映射
+        self.compacting = False
+        # 合并期间切换了站点：旧基础段暂不查询，合并结束后再重新映射
+        self._detached = False
+        self.compacted_at = time.monotonic()
+
+    def __len__(self) -> int:
+        base_docs = 0 if self._detached else self._n_docs
+        return base_docs + sum(1 for tid in self._delta if self._base_doc(tid) is None)
+
+    # ---- 切词 ----
+
+    @classmethod
+    def tokenize(cls, text: str) -> set:
+        tokens = set()
+        for run in cls.TOKEN_RE.findall((text or "").casefold()):
+            if run.isascii():
+                tokens.add(run)
+            else:
+                tokens.update(run)
+                tokens.update(run[i : i + 2] for i in range(len(run) - 1))
+        return tokens
+
+    @classmethod
+    def query_tokens(cls, query: str) -> set:
+        """查询只用最长的切分：中文两个字以上只取二元组"""
+        tokens = set()
+        for run in cls.TOKEN_RE.findall((query or "").casefold()):
+            if run.isascii() or len(run) == 1:
+                tokens.add(run)
+            else:
+                tokens.update(run[i : i + 2] for i in range(len(run) - 1))
+        return tokens
+
+    # ---- 写入 ----
+
+    def add(self, thread_id: int, title: str, text: str = "") -> bool:
+        """索引一个主题；内容没有变化时跳过，返回是否有更新"""
+        title = (title or "").strip()
+        text = self.BBCODE_RE.sub(" ", text or "")[: self.MAX_TEXT]
+        if not thread_id or not title:
+            return False
+        title_crc = zlib.crc32(title.encode("utf-8"))
+        full_crc = zlib.crc32(f"{title}\n{text}".encode("utf-8")) if text else 0
+
+        current = self._delta.get(thread_id)
+        if current is not None:
+            known_title_crc, known_full_crc = current[1], current[2]
+        else:
+            base = self._base_doc(thread_id)
+            known_title_crc, known_full_crc = (base[2], base[3]) if base else (None, None)
+        if known_title_crc == title_crc and (not text or known_full_crc == full_crc):
+            return False
+
+        tokens = frozenset(self.tokenize(f"{title}\n{text}"))
+        inherit = False
+        if not text and known_full_crc:
+            # 只拿到新标题（如主题列表里的改名）：保留已索引的首帖词，旧标题的词等下次带首帖时再清掉
+            full_crc = known_full_crc
+            if current is not None:
+                tokens |= current[3]
+                inherit = current[4]
+            else:
+                inherit = True
+        self._drop_delta(thread_id)
+        self._delta[thread_id] = (title, title_crc, full_crc, tokens, inherit)
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(thread_id)
+        return True
+
+    def _drop_delta(self, thread_id: int) -> None:
+        entry = self._delta.pop(thread_id, None)
+        if entry is None:
+            return
+        for token in entry[3]:
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(thread_id)
+                if not ids:
+                    del self._postings[token]
+
+    @property
+    def pending(self) -> int:
+        return len(self._delta)
+
+    # ---- 查询 ----
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, str]]:
+        tokens = self.query_tokens(query)
+        if not tokens:
+            return []
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            ids = set(self._postings.get(token, ()))
+            ids.update(tid for tid in self._base_postings(token) if self._uses_base(tid))
+            for tid in ids:
+                counts[tid] = counts.get(tid, 0) + 1
+
+        # 优先要求包含全部词；没有结果时放宽到至少一半
+        needed = len(tokens)
+        hits = [tid for tid, count in counts.items() if count >= needed]
+        if not hits:
+            needed = max(1, math.ceil(len(tokens) / 2))
+            hits = [tid for tid, count in counts.items() if count >= needed]
+
+        needle = (query or "").strip().casefold()
+        results = []
+        for tid in hits:
+            title = self.title(tid)
+            if title is not None:
+                results.append((counts[tid], needle in title.casefold(), tid, title))
+        results.sort(reverse=True)
+        return [(tid, title) for _, _, tid, title in results[:limit]]
+
+    def _uses_base(self, thread_id: int) -> bool:
+        entry = self._delta.get(thread_id)
+        return entry is None or entry[4]
+
+    def title(self, thread_id: int) -> Optional[str]:
+        entry = self._delta.get(thread_id)
+        if entry is not None:
+            return entry[0]
+        base = self._base_doc(thread_id)
+        return base[1] if base else None
+
+    # ---- 基础段（mmap） ----
+
+    def load(self) -> None:
+        """映射磁盘上的基础段；文件不存在、损坏或属于其他站点时忽略"""
+        self.close()
+        self._detached = False
+        try:
+            self._file = open(self.path, "rb")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, n_terms, n_docs, n_postings, site_len = self.HEADER.unpack_from(self._mm, 0)
+            site = self._mm[self.HEADER.size : self.HEADER.size + site_len].decode("utf-8")
+            if magic != self.MAGIC or version != self.VERSION or site != self.site:
+                raise ValueError("索引文件版本或站点不匹配")
+        except FileNotFoundError:
+            self.close()
+            return
+        except Exception as e:
+            logger.warning(f"[XenForo] 搜索索引文件不可用，将重新建立: {e}")
+            self.close()
+            return
+        self._n_terms, self._n_docs = n_terms, n_docs
+        self._terms_at = self.HEADER.size + site_len
+        self._docs_at = self._terms_at + n_terms * self.TERM.size
+        self._postings_at = self._docs_at + n_docs * self.DOC.size
+        self._blob_at = self._postings_at + n_postings * 4
+
+    def close(self) -> None:
+        if self._mm is not None:
+            with contextlib.suppress(BufferError):
+                self._mm.close()
+        if self._file is not None:
+            self._file.close()
+        self._mm = self._file = None
+        self._n_terms = self._n_docs = 0
+
+    def _blob(self, offset: int, length: int) -> bytes:
+        start = self._blob_at + offset
+        return self._mm[start : start + length]
+
+    def _term_at(self, index: int) -> Tuple[bytes, int, int]:
+        term_off, term_len, post_off, post_count = self.TERM.unpack_from(self._mm, self._terms_at + index * self.TERM.size)
+        return self._blob(term_off, term_len), post_off, post_count
+
+    def _base_postings(self, token: str) -> Tuple[int, ...]:
+        if self._mm is None or self._detached:
+            return ()
+        target = token.encode("utf-8")
+        lo, hi = 0, self._n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            term, post_off, post_count = self._term_at(mid)
+            if term < target:
+                lo = mid + 1
+            elif term > target:
+                hi = mid
+            else:
+                return struct.unpack_from(f"<{post_count}I", self._mm, self._postings_at + post_off * 4)
+        return ()
+
+    def _base_doc(self, thread_id: int) -> Optional[Tuple[int, str, int, int]]:
+        if self._mm is None or self._detached:
+            return None
+        lo, hi = 0, self._n_docs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            tid, title_off, title_len, title_crc, full_crc = self.DOC.unpack_from(self._mm, self._docs_at + mid * self.DOC.size)
+            if tid < thread_id:
+                lo = mid + 1
+            elif tid > thread_id:
+                hi = mid
+            else:
+                return tid, self._blob(title_off, title_len).decode("utf-8"), title_crc, full_crc
+        return None
+
+    # ---- 合并 ----
+
+    def snapshot(self) -> Tuple[dict, str]:
+        """在事件循环中取增量快照和所属站点，交给 compact() 在线程里合并；之后必须调用 finish_compact()"""
+        self.compacting = True
+        return dict(self._delta), self.site
+
+    def compact(self, delta: dict, site: str) -> bool:
+        """把基础段与增量快照合并写成新文件（可在线程中运行，只读基础段）
+
+        site 为取快照时的站点；合并期间站点被切换时丢弃结果，返回是否写入了文件。
+        """
+        postings: Dict[bytes, set] = {}
+        for index in range(self._n_terms):
+            term, post_off, post_count = self._term_at(index)
+            ids = struct.unpack_from(f"<{post_count}I", self._mm, self._postings_at + post_off * 4)
+            kept = {tid for tid in ids if tid not in delta or delta[tid][4]}
+            if kept:
+                postings[term] = kept
+        for tid, (_, _, _, tokens, _) in delta.items():
+            for token in tokens:
+                postings.setdefault(token.encode("utf-8"), set()).add(tid)
+
+        docs = {}
+        for index in range(self._n_docs):
+            tid, title_off, title_len, title_crc, full_crc = self.DOC.unpack_from(self._mm, self._docs_at + index * self.DOC.size)
+            if tid not in delta:
+                docs[tid] = (self._blob(title_off, title_len), title_crc, full_crc)
+        for tid, (title, title_crc, full_crc, _, _) in delta.items():
+            docs[tid] = (title.encode("utf-8"), title_crc, full_crc)
+
+        blob = bytearray()
+        term_table = bytearray()
+        postings_data = array("I")
+        for term in sorted(postings):
+            ids = sorted(postings[term])
+            term_table += self.TERM.pack(len(blob), len(term), len(postings_data), len(ids))
+            blob += term
+            postings_data.extend(ids)
+        doc_table = bytearray()
+        for tid in sorted(docs):
+            title, title_crc, full_crc = docs[tid]
+            doc_table += self.DOC.pack(tid, len(blob), len(title), title_crc, full_crc)
+            blob += title
+        if sys.byteorder != "little":
+            postings_data.byteswap()
+
+        site_bytes = site.encode("utf-8")
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER.pack(
+                self.MAGIC, self.VERSION, 0, len(postings), len(docs), len(postings_data), len(site_bytes)
+            ))
+            f.write(site_bytes)
+            f.write(term_table)
+            f.write(doc_table)
+            f.write(postings_data.tobytes())
+            f.write(blob)
+        if site != self.site:
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, self.path)
+        return True
+
+    def finish_compact(self, delta: dict) -> None:
+        """合并结束后（回到事件循环）重新映射文件，并移出已合并且未再变化的增量文档；合并失败时 delta 传空"""
+        self.compacting = False
+        self.load()
+        for tid, entry in delta.items():
+            if self._delta.get(tid) is entry:
+                self._drop_delta(tid)
+        self.compacted_at = time.monotonic()
+
+    def reset(self, site: str) -> None:
+        """切换站点：清空增量并丢弃旧站点的基础段"""
+        self.site = site
+        self._delta.clear()
+        self._postings.clear()
+        if self.compacting:
+            # 合并线程还在读旧基础段，等 finish_compact() 再重新映射
+            self._detached = True
+            return
+        self.load()
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class ForumBusyError(Exception):
+    """站点的并发额度在等待时间内没有空出来"""
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却期过后放行一个探测请求（半开）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+
+    def configure(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+    def allow(self) -> bool:
+        if self.threshold <= 0 or self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self._probing = False
+        self.failures = 0
+        if self.state != self.CLOSED:
+            logger.info("[XenForo] 论坛已恢复，熔断器关闭")
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.threshold > 0 and self.failures >= self.threshold):
+            if self.state != self.OPEN:
+                logger.warning(f"[XenForo] 连续 {self.failures} 次请求失败，熔断 {self.reset_timeout:.0f}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """探测请求被取消时释放名额，不计成功或失败"""
+        self._probing = False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class XenForoClient:
+    """XenForo API 异步客户端：共享 aiohttp 连接池，复用 keep-alive 连接
+
+    所有请求都先经过熔断器和自适应限速；429/5xx 按 Retry-After 或带抖动的指数退避重试。
+    """
+
+    def __init__(
+        self,
+        base_url: str = "",
+        api_key: str = "",
+        timeout: float = 10,
+        pool_size: int = 20,
+        pool_per_host: int = 10,
+        metrics: Optional[Metrics] = None,
+        forum: str = "default",
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pool_per_host = pool_per_host
+        self.limiter = RateLimiter()
+        self.breaker = CircuitBreaker()
+        self.metrics = metrics or Metrics()
+        # 指标里的 forum 标签，区分多站点
+        self.forum = forum
+        self.max_retries = 2
+        self.retry_backoff = 0.5
+        self.retry_max_delay = 10.0
+        self.retries = 0
+        self.throttled = 0
+        # 条件请求的校验值：请求键 -> (ETag, Last-Modified)
+        self._validators: "OrderedDict[tuple, Tuple[Optional[str], Optional[str]]]" = OrderedDict()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def configure(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: float,
+        pool_size: int,
+        pool_per_host: int,
+        rate_limit: float = 10,
+        rate_burst: int = 20,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+        retry_max_delay: float = 10,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30,
+    ) -> None:
+        """更新站点配置；连接池参数变化时在下次请求前重建会话"""
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.limiter.configure(rate_limit, rate_burst)
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.retry_max_delay = retry_max_delay
+        self.breaker.configure(breaker_threshold, breaker_reset)
+        if (pool_size, pool_per_host) != (self.pool_size, self.pool_per_host):
+            self.pool_size = pool_size
+            self.pool_per_host = pool_per_host
+            old, self._session = self._session, None
+            if old is not None and not old.closed:
+                asyncio.ensure_future(old.close())
+
+    def _headers(self) -> dict:
+        return {
+            "XF-Api-Key": self.api_key,
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # 会话必须在事件循环内创建，因此延迟到第一次请求时
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_per_host,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def get(self, path: str, params: Optional[dict] = None, conditional: bool = False) -> Tuple[int, bytes]:
+        """GET 请求，返回 (状态码, 响应体)；熔断时抛出 CircuitOpenError
+
+        conditional=True 时带上次响应的 ETag/Last-Modified，内容未变化时返回 304。
+        """
+        if not self.breaker.allow():
+            self.metrics.inc("breaker_rejected_total", forum=self.forum)
+            raise CircuitOpenError("论坛暂时无法访问，已暂停请求")
+        try:
+            status, body = await self._get_with_retry(path, params, conditional)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        if status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return status, body
+
+    async def _get_with_retry(self, path: str, params: Optional[dict], conditional: bool = False) -> Tuple[int, bytes]:
+        """429/5xx 在重试次数用尽后原样返回"""
+        query = {k: str(v) for k, v in (params or {}).items()}
+        labels = {"endpoint": Metrics.endpoint(path), "forum": self.forum}
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            self.metrics.inc("upstream_requests_total", source=REQUEST_SOURCE.get(), forum=self.forum)
+            started = time.monotonic()
+            try:
+                status, body, retry_after = await self._get_once(path, query, conditional)
+            except asyncio.TimeoutError:
+                self.metrics.inc("upstream_timeouts_total", **labels)
+                raise
+            except Exception:
+                self.metrics.inc("upstream_errors_total", **labels)
+                raise
+            finally:
+                self.metrics.observe("upstream_request_seconds", time.monotonic() - started, **labels)
+            self.metrics.inc("upstream_responses_total", status=status, **labels)
+            if status == 429:
+                self.throttled += 1
+                self.limiter.on_throttled(retry_after)
+            elif status >= 500:
+                self.limiter.on_server_error()
+            else:
+                self.limiter.on_success()
+                return status, body
+
+            if attempt >= self.max_retries:
+                return status, body
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            if delay > self.retry_max_delay:
+                # 等待时间过长时不再重试，直接把错误交给调用方
+                return status, body
+            attempt += 1
+            self.retries += 1
+            logger.warning(f"[XenForo] {path} 返回 {status}，{delay:.1f}s 后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        # 全抖动指数退避：[0, base * 2^attempt)
+        return random.uniform(0, self.retry_backoff * (2 ** attempt))
+
+    async def _get_once(self, path: str, query: dict, conditional: bool = False) -> Tuple[int, bytes, Optional[float]]:
+        session = self._get_session()
+        headers = self._headers()
+        key = (path, tuple(sorted(query.items())))
+        if conditional and key in self._validators:
+            etag, last_modified = self._validators[key]
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        async with session.get(
+            f"{self.base_url}{path}",
+            headers=headers,
+            params=query,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as response:
+            # 读完响应体，连接才能归还到连接池
+            body = await response.read()
+            if conditional and response.status == 200:
+                validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                if any(validators):
+                    self._validators[key] = validators
+                    self._validators.move_to_end(key)
+                    while len(self._validators) > 64:
+                        self._validators.popitem(last=False)
+            return response.status, body, parse_retry_after(response.headers.get("Retry-After"))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class ForumBackend:
+    """一个 XenForo 站点的运行时状态：独立的连接池、限速、熔断、并发额度、缓存和本地索引
+
+    配置多个站点时互不影响：某个站点变慢或熔断，只会占满它自己的连接和并发额度。
+    """
+
+    def __init__(self, name: str, data_dir: str, metrics: Metrics):
+        self.name = name
+        # None 表示还没配置过，第一次 configure 时一定会按站点重置索引
+        self.xf_url: Optional[str] = None
+        self.xf_api_key = ""
+        self.groups: Tuple[str, ...] = ()
+        self.watch_groups: Tuple[str, ...] = ()
+        self.client = XenForoClient(metrics=metrics, forum=name)
+        self.cache = ResponseCache()
+        self.last_good = ResponseCache()
+        # 本次运行中已经查过磁盘缓存的键：每个键只在第一次未命中时读盘
+        self.disk_checked: set = set()
+        self.revalidating: set = set()
+        self.inflight = SingleFlight()
+        self.prerendered: Dict[tuple, Tuple[float, str]] = {}
+        self.hot_index = HotThreadIndex()
+        self.user_index = UserIndex()
+        filename = "search_index.bin" if name == "default" else f"search_index_{re.sub(r'[^0-9A-Za-z_-]', '_', name)}.bin"
+        self.search_index = ThreadSearchIndex(os.path.join(data_dir, filename))
+        # 正在进行的搜索索引合并（线程），关闭前要等它结束
+        self.search_compaction: Optional[asyncio.Future] = None
+        # 主题每页帖子数（XenForo 默认 20），从帖子列表的 pagination 中更新，用来推算最后一页
+        self.posts_per_page = 20
+        # 主题接口是否自带 Forum（含 breadcrumbs）；自带时不再单独请求板块
+        self.thread_has_forum = False
+        self.concurrency = 0
+        self.budget = asyncio.Semaphore(1)
+        self.active = 0
+        self.busy_rejected = 0
+        self.last_command_at = 0.0
+
+    def configure(self, entry: dict, cfg: "Config") -> None:
+        """entry 为 forums 中的一项；未单独配置的连接池、限速、熔断参数沿用顶层配置"""
+
+        def option(name: str):
+            value = entry.get(name)
+            return getattr(cfg, name) if value is None else value
+
+        xf_url = str(entry.get("xf_url") or "").strip().rstrip("/")
+        if xf_url != self.xf_url:
+            # 站点地址变了，旧站点的缓存和索引不能再用
+            self.cache.clear()
+            self.last_good.clear()
+            self.disk_checked.clear()
+            self.prerendered.clear()
+            self.hot_index.clear()
+            self.user_index.clear()
+            self.search_index.reset(xf_url)
+        self.xf_url = xf_url
+        self.xf_api_key = str(entry.get("xf_api_key") or "").strip()
+        self.groups = tuple(str(g) for g in entry.get("groups") or () if str(g).strip())
+        self.watch_groups = tuple(str(g) for g in entry.get("watch_groups") or () if str(g).strip())
+        pool_per_host = max(1, int(option("pool_per_host")))
+        self.client.configure(
+            base_url=self.xf_url,
+            api_key=self.xf_api_key,
+            timeout=float(option("request_timeout")),
+            pool_size=max(1, int(option("pool_size"))),
+            pool_per_host=pool_per_host,
+            rate_limit=float(option("rate_limit")),
+            rate_burst=int(option("rate_burst")),
+            max_retries=cfg.max_retries,
+            retry_backoff=cfg.retry_backoff,
+            retry_max_delay=cfg.retry_max_delay,
+            breaker_threshold=cfg.breaker_threshold,
+            breaker_reset=cfg.breaker_reset,
+        )
+        # 并发额度默认等于每主机连接数：超出的请求在这里排队，而不是挤在连接池里
+        concurrency = max(1, int(entry.get("concurrency") or pool_per_host))
+        if concurrency != self.concurrency:
+            # 正在进行的请求归还到旧的信号量，不影响新额度
+            self.concurrency = concurrency
+            self.budget = asyncio.Semaphore(concurrency)
+        self.cache.resize(cfg.cache_max_entries)
+        self.last_good.resize(cfg.cache_max_entries)
+        self.hot_index.max_size = max(10, cfg.hot_index_size)
+        self.user_index.max_size = max(10, cfg.user_index_size)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.xf_url and self.xf_api_key)
+
+    async def get(
+        self, path: str, params: Optional[dict] = None, conditional: bool = False, wait: float = 10
+    ) -> Tuple[int, bytes]:
+        """在站点并发额度内请求；wait 秒内等不到额度时抛出 ForumBusyError"""
+        budget = self.budget
+        try:
+            await asyncio.wait_for(budget.acquire(), timeout=wait)
+        except asyncio.TimeoutError:
+            self.busy_rejected += 1
+            raise ForumBusyError(f"{self.name} 请求过多，请稍后再试") from None
+        self.active += 1
+        try:
+            return await self.client.get(path, params=params, conditional=conditional)
+        finally:
+            self.active -= 1
+            budget.release()
+
+    async def close(self) -> None:
+        if self.search_compaction is not None:
+            await asyncio.wait([self.search_compaction])
+        self.search_index.close()
+        await self.client.close()
+
+
+# 导出的指标说明（Prometheus HELP 行）
+METRIC_DESCRIPTIONS = (
+    ("upstream_requests_total", "发往 XenForo 的请求数，按触发的命令区分"),
+    ("upstream_responses_total", "XenForo 响应数，按端点和状态码区分"),
+    ("upstream_timeouts_total", "XenForo 请求超时次数"),
+    ("upstream_errors_total", "XenForo 请求连接错误次数"),
+    ("upstream_request_seconds", "XenForo 单次请求耗时（秒）"),
+    ("breaker_rejected_total", "熔断期间被拒绝的请求数"),
+    ("cache_requests_total", "缓存查询次数，result 为 hit/stale/miss"),
+    ("stale_fallbacks_total", "论坛不可用时返回旧数据的次数"),
+    ("cache_disk_loads_total", "从磁盘缓存恢复的响应数"),
+    ("command_seconds", "命令处理耗时（秒）"),
+    ("command_errors_total", "命令处理出错次数"),
+    ("command_throttled_total", "因触发过于频繁被限流的命令数，result 为 cached/cooldown"),
+    ("notify_wait_seconds", "通知在队列中等待的时间（秒）"),
+    ("notify_duplicates_total", "重复投递而被忽略的通知数"),
+    ("notify_auth_failures_total", "签名校验失败而被拒绝的通知请求数"),
+    ("notify_send_seconds", "发送一条群消息的耗时（秒）"),
+    ("send_wait_seconds", "消息在发送调度中等待的时间（秒），lane 为 interactive/bulk"),
+)
+
+
+class CommandSpec:
+    """命令表中的一项：处理函数、参数要求和调用统计"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[str], AsyncIterator[str]],
+        error_label: str,
+        usage: str = "",
+        needs_api: bool = True,
+        admin: bool = False,
+    ):
+        self.name = name
+        self.handler = handler
+        self.error_label = error_label
+        # 需要参数的命令在参数为空时回复用法
+        self.usage = usage
+        self.needs_api = needs_api
+        self.admin = admin
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += int(failed)
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_ms": round(self.total_time / self.calls * 1000, 1) if self.calls else 0,
+            "max_ms": round(self.max_time * 1000, 1),
+        }
+
 
 @register("xenforo_astrbot", "HuoNiu", "XenForo 论坛集成插件", "1.0.2")
 class Main(Star):
@@ -34,13 +2159,79 @@ class Main(Star):
         super().__init__(context)
 
         self._cfg_path = self._resolve_config_path("config.json")
-        self.cfg = self._safe_load_config(self._cfg_path)
-        self._apply_cfg()
+        self._data_dir = self._resolve_data_dir()
+        self._metrics = Metrics()
+        for name, help_text in METRIC_DESCRIPTIONS:
+            self._metrics.describe(name, help_text)
+        self._disk_cache = PersistentCache(os.path.join(self._data_dir, "api_cache.sqlite3"))
+        # 站点名 -> 站点状态；群号 -> 站点名，未绑定的群使用默认站点
+        self._forums: Dict[str, ForumBackend] = {}
+        self._group_forums: Dict[str, str] = {}
+        self._default_forum = "default"
+        self._watch_cursors: Optional[dict] = None
+        self._templates = ReplyTemplates()
+        self._command_limiter = SlidingWindowLimiter()
+        # 最近一次查询结果：(站点, 群号, 命令, 参数) -> 回复列表，限流时代替上游请求
+        self._recent_replies = ResponseCache(max_entries=512)
+        # 已接收通知的摘要，notify_dedupe_window 秒内相同的通知只发送一次
+        self._notify_seen = ResponseCache()
+        self._tasks: set = set()
+        self._background_started = False
+        self._cfg_loaded_mtime = self._cfg_mtime()
+        cfg = self._safe_load_config(self._cfg_path)
+        self._send_scheduler = SendScheduler(metrics=self._metrics)
+        self._notify_queue = NotificationQueue(
+            self._send_group_message,
+            workers=cfg.notify_workers,
+            maxsize=cfg.notify_queue_size,
+            metrics=self._metrics,
+        )
+        self._notify_coalescer = NotificationCoalescer(self._notify_queue, on_queued=self._remember_notifications)
+        self._apply_cfg(cfg)
+        self._commands = self._build_commands()
+        self._command_re = self._compile_command_pattern()
 
         logger.info("[XenForo] 插件已初始化")
         
         # 注册HTTP路由接收XenForo通知
         self._register_http_routes()
+        self._start_background_tasks()
+
+    async def terminate(self):
+        """插件卸载时取消后台任务并关闭连接池"""
+        self._notify_coalescer.cancel()
+        self._send_scheduler.close()
+        for task in list(self._tasks):
+            task.cancel()
+        for forum in self._forums.values():
+            await self._compact_search_index(forum)
+        try:
+            await asyncio.to_thread(self._disk_cache.flush, self._disk_cache.take())
+        except Exception as e:
+            logger.error(f"[XenForo] 保存磁盘缓存失败: {e}")
+        await asyncio.to_thread(self._disk_cache.close)
+        for forum in self._forums.values():
+            await forum.close()
+
+    @property
+    def _forum(self) -> ForumBackend:
+        """当前站点：命令按群号路由（见 on_message），后台任务通过 _using_forum 逐个切换"""
+        return self._forums.get(CURRENT_FORUM.get()) or self._forums[self._default_forum]
+
+    @contextlib.contextmanager
+    def _using_forum(self, forum: ForumBackend):
+        token = CURRENT_FORUM.set(forum.name)
+        try:
+            yield forum
+        finally:
+            CURRENT_FORUM.reset(token)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """启动后台任务并持有引用，避免任务被提前回收"""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
 
     def _register_http_routes(self):
         """注册HTTP路由"""
@@ -53,29 +2244,96 @@ class Main(Star):
                     methods=['POST'],
                     handler=self._handle_xenforo_notification
                 )
+                # 注册批量通知端点
+                provider.register_http_route(
+                    path='/xenforo/notify/batch',
+                    methods=['POST'],
+                    handler=self._handle_xenforo_batch_notification
+                )
                 # 注册测试端点
                 provider.register_http_route(
                     path='/xenforo/test',
                     methods=['GET', 'POST'],
                     handler=self._handle_test
                 )
-                logger.info("[XenForo] HTTP路由已注册: /xenforo/notify, /xenforo/test")
+                # 注册指标端点（Prometheus 文本格式）
+                provider.register_http_route(
+                    path='/xenforo/metrics',
+                    methods=['GET'],
+                    handler=self._handle_metrics
+                )
+                logger.info("[XenForo] HTTP路由已注册: /xenforo/notify, /xenforo/notify/batch, /xenforo/test, /xenforo/metrics")
             else:
                 logger.warning("[XenForo] 当前AstrBot版本不支持HTTP路由注册")
         except Exception as e:
             logger.error(f"[XenForo] HTTP路由注册失败: {e}")
     
+    async def _read_json(self, request, body: Optional[bytes] = None):
+        """兼容不同 Web 框架的请求对象，读取 JSON 请求体；body 为已读取的原始请求体"""
+        if body is not None:
+            return json.loads(body)
+        if hasattr(request, 'json'):
+            return await request.json()
+        body = await request.body()
+        return json.loads(body)
+
+    async def _read_body(self, request) -> bytes:
+        """读取原始请求体（aiohttp: read，Quart: get_data，Starlette: body）"""
+        for name in ('read', 'get_data', 'body'):
+            reader = getattr(request, name, None)
+            if callable(reader):
+                body = await reader()
+                return body.encode("utf-8") if isinstance(body, str) else bytes(body)
+        raise TypeError("无法读取请求体")
+
+    async def _read_notification(self, request):
+        """配置了 notify_secret 时先校验签名再解析，返回 (数据, 错误响应)
+
+        签名为请求体的 HMAC-SHA256 十六进制值，放在 X-XenForo-Signature 头中（可带 sha256= 前缀）。
+        """
+        secret = self.cfg.notify_secret
+        if not secret:
+            return await self._read_json(request), None
+        body = await self._read_body(request)
+        signature = str((getattr(request, 'headers', None) or {}).get('X-XenForo-Signature', '') or '')
+        if signature.startswith('sha256='):
+            signature = signature[len('sha256='):]
+        expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(signature.strip().lower(), expected):
+            self._metrics.inc("notify_auth_failures_total")
+            logger.warning("[XenForo] 通知签名校验失败，已拒绝")
+            return None, ({'error': '签名无效'}, 401)
+        return await self._read_json(request, body), None
+
+    def _notify_key(self, idempotency_key: str, group_id: str, message: str, event_type: str) -> bytes:
+        """去重键：有幂等键时用幂等键，否则用事件类型、群号和消息内容的摘要"""
+        if idempotency_key:
+            raw = f"key\0{idempotency_key}"
+        else:
+            raw = f"{event_type}\0{group_id}\0{message}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+    def _notify_duplicate(self, key: bytes) -> bool:
+        if self.cfg.notify_dedupe_window <= 0:
+            return False
+        if key in self._notify_coalescer:
+            return True
+        hit = self._notify_seen.get(key)
+        return hit is not None and hit[1] < self.cfg.notify_dedupe_window
+
+    def _remember_notifications(self, keys: list) -> None:
+        """通知入队成功后才记下去重键，入队失败的通知重试时仍会处理"""
+        for key in keys:
+            self._notify_seen.set(key, True)
+
     async def _handle_xenforo_notification(self, request):
-        """处理来自XenForo的通知"""
+        """处理来自XenForo的通知：校验后入队，立即返回 202，由后台 worker 发送"""
         try:
-            # 获取JSON数据
-            if hasattr(request, 'json'):
-                data = await request.json()
-            else:
-                import json
-                body = await request.body()
-                data = json.loads(body)
-            
+            self._start_background_tasks()
+            data, rejected = await self._read_notification(request)
+            if rejected:
+                return rejected
+
             group_id = str(data.get('group_id', ''))
             message = data.get('message', '')
             event_type = data.get('event_type', '')
@@ -84,33 +2342,208 @@ class Main(Star):
                 logger.warning(f"[XenForo] 收到无效通知数据: {data}")
                 return {'error': '缺少必要参数'}, 400
             
+            idempotency_key = str(
+                (getattr(request, 'headers', None) or {}).get('Idempotency-Key') or data.get('idempotency_key') or ''
+            )
+            key = self._notify_key(idempotency_key, group_id, message, event_type)
+            if self._notify_duplicate(key):
+                self._metrics.inc("notify_duplicates_total")
+                logger.info(f"[XenForo] 忽略重复通知 {event_type} -> 群 {group_id}")
+                return {'status': 'duplicate'}, 200
+
             logger.info(f"[XenForo] 收到通知 {event_type} -> 群 {group_id}")
-            
-            # 发送到QQ群
-            try:
-                await self.context.send_message(
-                    message_type="group",
-                    target_id=group_id,
-                    message=message
-                )
-                logger.info(f"[XenForo] 通知已发送到群 {group_id}")
-                return {'status': 'success'}, 200
-            except Exception as e:
-                logger.error(f"[XenForo] 发送消息到群 {group_id} 失败: {e}")
-                return {'error': f'发送失败: {str(e)}'}, 500
+
+            if not self._notify_queue.put(group_id, message, event_type):
+                logger.warning(f"[XenForo] 通知队列已满，拒绝通知 {event_type} -> 群 {group_id}")
+                return {'error': '通知队列已满，请稍后重试'}, 503
+            self._remember_notifications([key])
+            return {'status': 'queued'}, 202
                 
         except Exception as e:
             logger.error(f"[XenForo] 处理通知失败: {e}")
             return {'error': str(e)}, 500
+
+    async def _handle_xenforo_batch_notification(self, request):
+        """批量通知：{"events": [{group_id, message, event_type, node_title}, ...]}
+
+        同一个群在 notify_coalesce_window 秒内的通知会合并成一条汇总消息。
+        """
+        try:
+            self._start_background_tasks()
+            data, rejected = await self._read_notification(request)
+            if rejected:
+                return rejected
+            events = data.get('events') if isinstance(data, dict) else data
+            if not isinstance(events, list) or not events:
+                logger.warning(f"[XenForo] 收到无效批量通知数据: {data}")
+                return {'error': '缺少 events 数组'}, 400
+
+            valid = []
+            batch_keys = set()
+            duplicates = 0
+            for item in events:
+                if not isinstance(item, dict):
+                    continue
+                group_id = str(item.get('group_id', ''))
+                message = item.get('message', '')
+                if not group_id or not message:
+                    continue
+                event_type = item.get('event_type', '')
+                key = self._notify_key(str(item.get('idempotency_key') or ''), group_id, message, event_type)
+                if key in batch_keys or self._notify_duplicate(key):
+                    duplicates += 1
+                    continue
+                batch_keys.add(key)
+                valid.append((key, group_id, message, event_type, item.get('node_title', '')))
+
+            if duplicates:
+                self._metrics.inc("notify_duplicates_total", duplicates)
+            if not valid:
+                if duplicates:
+                    return {'status': 'duplicate', 'accepted': 0, 'duplicates': duplicates}, 200
+                return {'error': '缺少必要参数'}, 400
+            # 接收时就为每个群的汇总消息预留队列位置；去重键等汇总消息入队后再记下（见 _remember_notifications）
+            accepted = self._notify_coalescer.add_many([
+                (group_id, message, event_type, node_title, key)
+                for key, group_id, message, event_type, node_title in valid
+            ])
+            if not accepted:
+                logger.warning(f"[XenForo] 通知队列已满，拒绝 {len(valid)} 条批量通知")
+                return {'error': '通知队列已满，请稍后重试'}, 503
+
+            skipped = len(events) - len(valid) - duplicates
+            logger.info(f"[XenForo] 收到批量通知 {len(valid)} 条（重复 {duplicates} 条，跳过 {skipped} 条无效数据）")
+            return {'status': 'queued', 'accepted': len(valid), 'duplicates': duplicates, 'skipped': skipped}, 202
+
+        except Exception as e:
+            logger.error(f"[XenForo] 处理批量通知失败: {e}")
+            return {'error': str(e)}, 500
+
+    async def _send_group_message(self, group_id: str, message: str) -> None:
+        # 通知走低优先级通道，命令回复先发
+        await self._send_scheduler.acquire(group_id, SendScheduler.BULK)
+        await self.context.send_message(
+            message_type="group",
+            target_id=group_id,
+            message=message
+        )
     
     async def _handle_test(self, request):
         """测试端点"""
         return {
             'status': 'ok',
             'message': 'AstrBot XenForo插件运行正常',
-            'version': '1.0.2'
+            'version': '1.0.2',
+            'notify_queue': {**self._notify_queue.stats(), 'merged': self._notify_coalescer.merged},
+            'send_scheduler': self._send_scheduler.stats(),
+            'commands': {name: spec.stats() for name, spec in self._commands.items() if spec.calls},
         }, 200
 
+    async def _handle_metrics(self, request):
+        """指标端点：Prometheus 文本格式"""
+        text = self._metrics.render(self._metric_gauges())
+        return text, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    def _metric_gauges(self) -> Dict[str, Tuple[str, float]]:
+        forums = list(self._forums.values())
+        return {
+            "notify_queue_depth": ("通知队列当前积压数", self._notify_queue.depth()),
+            "notify_queue_max_depth": ("通知队列历史最大积压数", self._notify_queue.max_depth),
+            "send_queue_interactive": ("等待发送的命令回复数", self._send_scheduler.depth(SendScheduler.INTERACTIVE)),
+            "send_queue_bulk": ("等待发送的通知数", self._send_scheduler.depth(SendScheduler.BULK)),
+            "breaker_open": (
+                "熔断器打开的站点数",
+                sum(int(f.client.breaker.state != f.client.breaker.CLOSED) for f in forums),
+            ),
+            "forum_requests_active": ("正在进行的上游请求数（各站点合计）", sum(f.active for f in forums)),
+            "forum_busy_rejected": ("等不到站点并发额度而放弃的请求数", sum(f.busy_rejected for f in forums)),
+            "cache_entries": ("响应缓存条目数", sum(len(f.cache) for f in forums)),
+            "hot_index_threads": ("热门索引中的主题数", sum(len(f.hot_index) for f in forums)),
+            "user_index_users": ("用户名索引中的用户数", sum(len(f.user_index) for f in forums)),
+            "search_index_threads": ("全文索引中的主题数", sum(len(f.search_index) for f in forums)),
+        }
+
+    def _status_text(self) -> str:
+        """管理员状态摘要：上游延迟、缓存命中率、命令负载、通知队列"""
+        metrics = self._metrics
+
+        def fmt(seconds: Optional[float]) -> str:
+            if seconds is None:
+                return "-"
+            return ">30s" if math.isinf(seconds) else f"≤{seconds:g}s"
+
+        msg = "📊 插件运行状态\n\n"
+        msg += "🌐 上游请求（次数 | p50 | p99 | 超时 | 错误）：\n"
+        latency = metrics.histogram("upstream_request_seconds")
+        if not latency:
+            msg += "  暂无请求\n"
+        responses = metrics.series("upstream_responses_total")
+        multi = len(self._forums) > 1
+        for key, (count, _) in sorted(latency.items()):
+            labels = dict(key)
+            failed = 0
+            for response_key, value in responses.items():
+                response_labels = dict(response_key)
+                if int(response_labels.pop("status")) >= 400 and response_labels == labels:
+                    failed += value
+            name = f"{labels.get('forum')} {labels['endpoint']}" if multi else labels["endpoint"]
+            msg += (
+                f"  {name}: {count} | {fmt(metrics.quantile('upstream_request_seconds', 0.5, **labels))}"
+                f" | {fmt(metrics.quantile('upstream_request_seconds', 0.99, **labels))}"
+                f" | {metrics.counter('upstream_timeouts_total', **labels):g}"
+                f" | {failed + metrics.counter('upstream_errors_total', **labels):g}\n"
+            )
+
+        hits = metrics.counter("cache_requests_total", result="hit")
+        stale = metrics.counter("cache_requests_total", result="stale")
+        misses = metrics.counter("cache_requests_total", result="miss")
+        total = hits + stale + misses
+        rate = f"{(hits + stale) / total:.0%}" if total else "-"
+        msg += f"\n💾 缓存命中率: {rate}（命中 {hits:g} / 过期返回 {stale:g} / 未命中 {misses:g}）\n"
+
+        sources = sorted(
+            ((dict(key)["source"], v) for key, v in metrics.series("upstream_requests_total").items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        if sources:
+            msg += "📈 API 调用来源: " + "，".join(f"{source} {count:g}" for source, count in sources) + "\n"
+
+        used = [spec for spec in self._commands.values() if spec.calls]
+        if used:
+            msg += "\n⌨️ 命令（次数 | 平均 | 最大 | 出错）：\n"
+            for spec in sorted(used, key=lambda spec: spec.calls, reverse=True):
+                stats = spec.stats()
+                msg += f"  {spec.name}: {stats['calls']} | {stats['avg_ms']}ms | {stats['max_ms']}ms | {stats['errors']}\n"
+        throttled = metrics.counter("command_throttled_total")
+        if throttled:
+            cached = metrics.counter("command_throttled_total", result="cached")
+            msg += f"🚦 限流 {throttled:g} 次（返回最近结果 {cached:g} 次）\n"
+
+        queue = self._notify_queue.stats()
+        msg += (
+            f"\n📢 通知队列: 积压 {queue['depth']}（最大 {queue['max_depth']}），已发送 {queue['sent']}，"
+            f"失败 {queue['failed']}，拒绝 {queue['rejected']}\n"
+            f"  发送耗时 p50 {fmt(metrics.quantile('notify_send_seconds', 0.5))}，"
+            f"p99 {fmt(metrics.quantile('notify_send_seconds', 0.99))}\n"
+        )
+        scheduler = self._send_scheduler.stats()
+        msg += (
+            f"🚥 发送调度: 等待中 命令 {scheduler['depth']['interactive']} / 通知 {scheduler['depth']['bulk']}"
+            f"（最大 {scheduler['max_depth']}）\n"
+            f"  等待 p99 命令 {fmt(metrics.quantile('send_wait_seconds', 0.99, lane='interactive'))}，"
+            f"通知 {fmt(metrics.quantile('send_wait_seconds', 0.99, lane='bulk'))}\n"
+        )
+        msg += "\n"
+        for forum in self._forums.values():
+            breaker = forum.client.breaker
+            label = f"「{forum.name}」" if multi else ""
+            msg += f"⚡ {label}熔断器: {breaker.state}，拒绝 {breaker.rejected} 次；重试 {forum.client.retries} 次"
+            if forum.busy_rejected:
+                msg += f"；并发额度不足 {forum.busy_rejected} 次"
+            msg += "\n"
+        return msg
+
     def _resolve_config_path(self, filename: str) -> str:
         get_config_path = getattr(self.context, "get_config_path", None)
         if callable(get_config_path):
@@ -122,65 +2555,429 @@ class Main(Star):
         # 兼容旧版：配置文件放在插件目录同级（例如 /root/AstrBot/data/plugins/xenforo_astrbot/config.json）
         return os.path.join(os.path.dirname(__file__), filename)
 
-    def _safe_load_config(self, cfg_path: str) -> Config:
+    def _resolve_data_dir(self) -> str:
+        """插件数据目录，用于保存游标、索引等运行时数据"""
+        try:
+            from astrbot.api.star import StarTools
+
+            return str(StarTools.get_data_dir("xenforo_astrbot"))
+        except Exception:
+            pass
+
+        # 兼容旧版：放在配置文件同级的 xenforo_data 目录
+        path = os.path.join(os.path.dirname(self._cfg_path), "xenforo_data")
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"[XenForo] 创建数据目录失败: {e}")
+        return path
+
+    def _write_json_atomic(self, filename: str, data) -> None:
+        """先写临时文件再替换，避免进程中断时留下半个文件"""
+        path = os.path.join(self._data_dir, filename)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_json_file(self, filename: str):
+        try:
+            with open(os.path.join(self._data_dir, filename), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[XenForo] 读取 {filename} 失败: {e}")
+            return None
+
+    def _safe_load_config(self, cfg_path: str, strict: bool = False) -> Config:
+        """读取并解析配置；strict=True（热加载）时读取或解析出错直接抛出 ValueError，不退回默认值"""
         cfg = Config()
         try:
             with open(cfg_path, "r", encoding="utf-8") as f:
                 raw = json.load(f) or {}
         except FileNotFoundError:
+            if strict:
+                raise ValueError(f"未找到配置文件: {cfg_path}")
             logger.warning(f"[XenForo] 未找到配置文件: {cfg_path}（将使用默认配置）")
             return cfg
         except Exception as e:
+            if strict:
+                raise ValueError(f"读取配置失败: {e}") from e
             logger.error(f"[XenForo] 读取配置失败，将使用默认配置: {e}")
             return cfg
 
+        fields = {}
         try:
-            cfg.xf_url = str(raw.get("xf_url", cfg.xf_url) or "")
-            cfg.xf_api_key = str(raw.get("xf_api_key", cfg.xf_api_key) or "")
-            cfg.threads_limit = int(raw.get("threads_limit", cfg.threads_limit) or cfg.threads_limit)
-            cfg.request_timeout = int(raw.get("request_timeout", cfg.request_timeout) or cfg.request_timeout)
-            cfg.require_slash = bool(raw.get("require_slash", cfg.require_slash))
+            fields["xf_url"] = str(raw.get("xf_url", cfg.xf_url) or "")
+            fields["xf_api_key"] = str(raw.get("xf_api_key", cfg.xf_api_key) or "")
+            fields["threads_limit"] = int(raw.get("threads_limit", cfg.threads_limit) or cfg.threads_limit)
+            fields["request_timeout"] = int(raw.get("request_timeout", cfg.request_timeout) or cfg.request_timeout)
+            fields["require_slash"] = bool(raw.get("require_slash", cfg.require_slash))
+            fields["pool_size"] = int(raw.get("pool_size", cfg.pool_size) or cfg.pool_size)
+            fields["pool_per_host"] = int(raw.get("pool_per_host", cfg.pool_per_host) or cfg.pool_per_host)
+            cache_ttl = raw.get("cache_ttl")
+            if isinstance(cache_ttl, dict):
+                fields["cache_ttl"] = {
+                    **cfg.cache_ttl,
+                    **{str(k).strip("/"): float(v or 0) for k, v in cache_ttl.items()},
+                }
+            fields["cache_stale_ttl"] = int(raw.get("cache_stale_ttl", cfg.cache_stale_ttl) or 0)
+            fields["cache_max_entries"] = int(raw.get("cache_max_entries", cfg.cache_max_entries) or cfg.cache_max_entries)
+            fields["cache_persist"] = bool(raw.get("cache_persist", cfg.cache_persist))
+            fields["cache_persist_max_age"] = int(raw.get("cache_persist_max_age", cfg.cache_persist_max_age) or cfg.cache_persist_max_age)
+            fields["cache_persist_max_entries"] = int(raw.get("cache_persist_max_entries", cfg.cache_persist_max_entries) or cfg.cache_persist_max_entries)
+            fields["cache_persist_compact_interval"] = int(raw.get("cache_persist_compact_interval", cfg.cache_persist_compact_interval) or cfg.cache_persist_compact_interval)
+            fields["config_reload_interval"] = int(raw.get("config_reload_interval", cfg.config_reload_interval) or 0)
+            fields["notify_workers"] = int(raw.get("notify_workers", cfg.notify_workers) or cfg.notify_workers)
+            fields["notify_queue_size"] = int(raw.get("notify_queue_size", cfg.notify_queue_size) or cfg.notify_queue_size)
+            fields["notify_coalesce_window"] = float(raw.get("notify_coalesce_window", cfg.notify_coalesce_window) or 0)
+            fields["notify_digest_max_items"] = int(raw.get("notify_digest_max_items", cfg.notify_digest_max_items) or cfg.notify_digest_max_items)
+            fields["notify_secret"] = str(raw.get("notify_secret", cfg.notify_secret) or "")
+            fields["notify_dedupe_window"] = int(raw.get("notify_dedupe_window", cfg.notify_dedupe_window) or 0)
+            fields["notify_dedupe_max_entries"] = int(raw.get("notify_dedupe_max_entries", cfg.notify_dedupe_max_entries) or cfg.notify_dedupe_max_entries)
+            fields["rate_limit"] = float(raw.get("rate_limit", cfg.rate_limit) or 0)
+            fields["rate_burst"] = int(raw.get("rate_burst", cfg.rate_burst) or cfg.rate_burst)
+            fields["max_retries"] = int(raw.get("max_retries", cfg.max_retries) or 0)
+            fields["retry_backoff"] = float(raw.get("retry_backoff", cfg.retry_backoff) or cfg.retry_backoff)
+            fields["retry_max_delay"] = float(raw.get("retry_max_delay", cfg.retry_max_delay) or 0)
+            fields["breaker_threshold"] = int(raw.get("breaker_threshold", cfg.breaker_threshold) or 0)
+            fields["breaker_reset"] = float(raw.get("breaker_reset", cfg.breaker_reset) or cfg.breaker_reset)
+            fields["prefetch_interval"] = int(raw.get("prefetch_interval", cfg.prefetch_interval) or 0)
+            fields["prefetch_idle_timeout"] = int(raw.get("prefetch_idle_timeout", cfg.prefetch_idle_timeout) or cfg.prefetch_idle_timeout)
+            fields["watch_interval"] = int(raw.get("watch_interval", cfg.watch_interval) or 0)
+            fields["watch_groups"] = [str(g) for g in (raw.get("watch_groups") or []) if str(g).strip()]
+            fields["watch_threads"] = bool(raw.get("watch_threads", cfg.watch_threads))
+            fields["watch_posts"] = bool(raw.get("watch_posts", cfg.watch_posts))
+            fields["watch_max_pages"] = int(raw.get("watch_max_pages", cfg.watch_max_pages) or cfg.watch_max_pages)
+            fields["hot_index_size"] = int(raw.get("hot_index_size", cfg.hot_index_size) or cfg.hot_index_size)
+            fields["hot_seed_pages"] = int(raw.get("hot_seed_pages", cfg.hot_seed_pages) or cfg.hot_seed_pages)
+            fields["hot_index_refresh"] = int(raw.get("hot_index_refresh", cfg.hot_index_refresh) or cfg.hot_index_refresh)
+            fields["reply_chunk_size"] = int(raw.get("reply_chunk_size", cfg.reply_chunk_size) or cfg.reply_chunk_size)
+            fields["list_max_pages"] = int(raw.get("list_max_pages", cfg.list_max_pages) or cfg.list_max_pages)
+            fields["list_prefetch"] = int(raw.get("list_prefetch", cfg.list_prefetch) or cfg.list_prefetch)
+            fields["user_index_size"] = int(raw.get("user_index_size", cfg.user_index_size) or cfg.user_index_size)
+            fields["user_index_ttl"] = int(raw.get("user_index_ttl", cfg.user_index_ttl) or 0)
+            fields["user_preload_pages"] = int(raw.get("user_preload_pages", cfg.user_preload_pages) or 0)
+            fields["search_results"] = int(raw.get("search_results", cfg.search_results) or cfg.search_results)
+            fields["search_compact_interval"] = int(raw.get("search_compact_interval", cfg.search_compact_interval) or cfg.search_compact_interval)
+            fields["search_compact_docs"] = int(raw.get("search_compact_docs", cfg.search_compact_docs) or cfg.search_compact_docs)
+            reply_templates = raw.get("reply_templates")
+            if isinstance(reply_templates, dict):
+                fields["reply_templates"] = {str(k): v for k, v in reply_templates.items() if isinstance(v, dict)}
+            forums = raw.get("forums")
+            if isinstance(forums, list):
+                fields["forums"] = [entry for entry in forums if isinstance(entry, dict)]
+            fields["command_user_limit"] = int(raw.get("command_user_limit", cfg.command_user_limit) or 0)
+            fields["command_group_limit"] = int(raw.get("command_group_limit", cfg.command_group_limit) or 0)
+            fields["command_window"] = int(raw.get("command_window", cfg.command_window) or cfg.command_window)
+            fields["send_rate"] = float(raw.get("send_rate", cfg.send_rate) or 0)
+            fields["send_burst"] = int(raw.get("send_burst", cfg.send_burst) or cfg.send_burst)
+            fields["send_group_interval"] = float(raw.get("send_group_interval", cfg.send_group_interval) or 0)
+            fields["thread_detail_excerpt"] = int(raw.get("thread_detail_excerpt", cfg.thread_detail_excerpt) or 0)
+            fields["thread_detail_replies"] = int(raw.get("thread_detail_replies", cfg.thread_detail_replies) or 0)
+            fields["thread_detail_breadcrumbs"] = bool(raw.get("thread_detail_breadcrumbs", cfg.thread_detail_breadcrumbs))
+            fields["thread_detail_deadline"] = max(0.0, float(raw.get("thread_detail_deadline", cfg.thread_detail_deadline) or 0))
         except Exception as e:
+            if strict:
+                raise ValueError(f"配置字段解析失败: {e}") from e
             logger.error(f"[XenForo] 配置字段解析失败，将使用默认值: {e}")
 
-        return cfg
+        return Config(**fields)
 
-    def _refresh_cfg(self) -> None:
-        self.cfg = self._safe_load_config(self._cfg_path)
-        self._apply_cfg()
-
-    def _apply_cfg(self) -> None:
-        self.xf_url = (self.cfg.xf_url or "").strip().rstrip("/")
-        self.xf_api_key = (self.cfg.xf_api_key or "").strip()
+    def _cfg_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._cfg_path).st_mtime_ns
+        except OSError:
+            return None
+
+    async def _reload_cfg(self) -> None:
+        """在线程中读取配置文件，解析并应用成功后才整体替换配置快照
+
+        读取或解析失败（如编辑器还没写完）时保留当前配置和站点，也不记下修改时间，下一轮检查会重试。
+        """
+        mtime = self._cfg_mtime()
+        cfg = await asyncio.to_thread(self._safe_load_config, self._cfg_path, True)
+        self._cfg_loaded_mtime = mtime
+        self._apply_cfg(cfg)
+        logger.info("[XenForo] 配置已重新加载")
+
+    async def _watch_config(self) -> None:
+        """定期检查配置文件修改时间，有变化时热加载"""
+        while True:
+            await asyncio.sleep(max(1, self.cfg.config_reload_interval or 5))
+            if self.cfg.config_reload_interval <= 0:
+                continue
+            try:
+                if self._cfg_mtime() != self._cfg_loaded_mtime:
+                    await self._reload_cfg()
+            except Exception as e:
+                logger.error(f"[XenForo] 配置热加载失败: {e}")
+
+    def _prefetch_jobs(self) -> list:
+        """后台预取的接口：(接口, 参数, 渲染方法)，参数须与对应命令一致"""
+        limit = int(self.cfg.threads_limit or 5)
+        return [
+            ("/api/threads", {"limit": limit}, lambda data: self._render_latest_threads(data, limit)),
+            ("/api/posts", {"limit": 5}, lambda data: self._render_latest_posts(data, 5)),
+            # 热门主题由本地索引实时排序，预取只负责喂数据
+            *[("/api/threads", self._hot_seed_params(page), None) for page in range(1, self.cfg.hot_seed_pages + 1)],
+            ("/api/index", None, self._render_forum_stats),
+        ]
+
+    async def _prefetch_loop(self) -> None:
+        """定期预取热点数据并渲染好回复文本；一段时间没有命令时暂停，节省 API 配额"""
+        while True:
+            await asyncio.sleep(max(5, self.cfg.prefetch_interval or 60))
+            if self.cfg.prefetch_interval <= 0:
+                continue
+            for forum in list(self._forums.values()):
+                # 各站点分别判断空闲：没人查询的站点不消耗它的 API 配额
+                if not forum.ready or time.monotonic() - forum.last_command_at > self.cfg.prefetch_idle_timeout:
+                    continue
+                with self._using_forum(forum):
+                    await self._prefetch_once()
+
+    async def _prefetch_once(self) -> None:
+        for path, params, render in self._prefetch_jobs():
+            try:
+                data, err = await self._api_fetch(path, params, fallback=False)
+                if err:
+                    logger.warning(f"[XenForo] 预取 {path} 失败: {err}")
+                    continue
+                key = self._cache_key(path, params)
+                if self._cache_ttl(path) > 0:
+                    self._cache_store(key, data)
+                if render is not None:
+                    self._forum.prerendered[key] = (time.monotonic(), render(data))
+            except Exception as e:
+                logger.error(f"[XenForo] 预取 {path} 出错: {e}")
+
+    async def _watch_loop(self) -> None:
+        """轮询新主题/新回复，发现新内容后推送到 watch_groups（无需 XenForo 端插件）"""
+        while True:
+            await asyncio.sleep(max(10, self.cfg.watch_interval or 60))
+            if self.cfg.watch_interval <= 0:
+                continue
+            for forum in list(self._forums.values()):
+                if not forum.watch_groups or not forum.ready:
+                    continue
+                try:
+                    with self._using_forum(forum):
+                        await self._watch_once()
+                except Exception as e:
+                    logger.error(f"[XenForo] 检查 {forum.name} 新内容失败: {e}")
+
+    async def _watch_once(self) -> None:
+        if self._watch_cursors is None:
+            saved = await asyncio.to_thread(self._read_json_file, "watch_cursors.json")
+            self._watch_cursors = saved if isinstance(saved, dict) else {}
+        # 游标按站点区分，切换站点后重新开始
+        cursors = self._watch_cursors.setdefault(self._forum.xf_url, {})
+        changed = False
+
+        jobs = []
+        if self.cfg.watch_threads:
+            jobs.append(("thread_id", "/api/threads", "threads", {"order": "post_date", "direction": "desc"}))
+        if self.cfg.watch_posts:
+            jobs.append(("post_id", "/api/posts", "posts", {"limit": 20}))
+
+        for id_field, path, list_key, params in jobs:
+            items = await self._fetch_new_items(path, list_key, id_field, params, cursors.get(id_field))
+            if items is None:
+                continue
+            newest = max((int(item.get(id_field) or 0) for item in items), default=0)
+            if id_field not in cursors:
+                # 首次运行只记录位置，不推送历史内容
+                cursors[id_field] = newest
+                changed = True
+                continue
+            fresh = sorted(
+                (item for item in items if int(item.get(id_field) or 0) > cursors[id_field]),
+                key=lambda item: int(item.get(id_field) or 0),
+            )
+            for item in fresh:
+                self._dispatch_new_content(id_field, item)
+            if fresh:
+                cursors[id_field] = max(cursors[id_field], newest)
+                changed = True
+
+        if changed:
+            await asyncio.to_thread(self._write_json_atomic, "watch_cursors.json", self._watch_cursors)
+
+    async def _fetch_new_items(
+        self, path: str, list_key: str, id_field: str, params: dict, cursor: Optional[int]
+    ) -> Optional[list]:
+        """从第一页起翻页，直到遇到游标之前的内容或达到 watch_max_pages；内容未变化时返回 None"""
+        items = []
+        for page in range(1, max(1, self.cfg.watch_max_pages) + 1):
+            # 只对第一页用条件请求：第一页没变化说明没有新内容
+            status, body = await self._forum.get(
+                path, {**params, "page": page}, conditional=(page == 1), wait=self._forum.client.timeout
+            )
+            if status == 304:
+                return None
+            if status != 200:
+                logger.warning(f"[XenForo] 检查新内容 {path}: {self._format_http_error(status)}")
+                return None if page == 1 else items
+            data = project_payload(json_loads(body))
+            self._observe(path, data)
+            batch = data.get(list_key, []) if isinstance(data, dict) else []
+            items.extend(batch)
+            if cursor is None or not batch:
+                break
+            if min(int(item.get(id_field) or 0) for item in batch) <= cursor:
+                break
+            pagination = data.get("pagination") or {}
+            if page >= int(pagination.get("last_page") or page):
+                break
+        return items
+
+    def _dispatch_new_content(self, id_field: str, item: dict) -> None:
+        if id_field == "thread_id":
+            thread_id = item.get("thread_id", "")
+            node_title = (item.get("Forum") or {}).get("title", "")
+            message = (
+                f"🆕 新主题：{item.get('title', '无标题')}\n"
+                f"作者: {item.get('username', '未知')}\n"
+                f"{self._forum.xf_url}/threads/{thread_id}/"
+            )
+            event_type = "thread_create"
+        else:
+            # 主题的首帖已经作为新主题推送过
+            if item.get("is_first_post") or item.get("position") == 0:
+                return
+            thread = item.get("Thread") or {}
+            node_title = (thread.get("Forum") or {}).get("title", "")
+            message = (
+                f"💬 {item.get('username', '未知')} 回复了：{thread.get('title', '无标题')}\n"
+                f"{self._forum.xf_url}/threads/{item.get('thread_id', '')}/#post-{item.get('post_id', '')}"
+            )
+            event_type = "post_create"
+
+        # 走合并通道，短时间内大量新内容会汇总成一条
+        for group_id in self._forum.watch_groups:
+            if not self._notify_coalescer.add(group_id, message, event_type, node_title):
+                logger.warning(f"[XenForo] 通知队列已满，丢弃群 {group_id} 的新内容推送")
+
+    def _get_prerendered(self, path: str, params: Optional[dict]) -> Optional[str]:
+        """取预取好的回复文本；超过两个预取周期未更新视为失效"""
+        entry = self._forum.prerendered.get(self._cache_key(path, params))
+        if entry is None or self.cfg.prefetch_interval <= 0:
+            return None
+        # 预取结果按默认模板渲染，自定义了模板的群要现渲染
+        if self._templates.customized(REPLY_GROUP.get()):
+            return None
+        rendered_at, text = entry
+        if time.monotonic() - rendered_at > self.cfg.prefetch_interval * 2:
+            return None
+        return text
+
+    def _start_background_tasks(self) -> None:
+        """启动后台任务；插件初始化时若事件循环尚未运行，则推迟到第一次处理命令时"""
+        if self._background_started:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._background_started = True
+        self._spawn(self._watch_config())
+        self._spawn(self._prefetch_loop())
+        self._spawn(self._watch_loop())
+        self._spawn(self._search_compact_loop())
+        self._spawn(self._disk_cache_loop())
+        if self.cfg.user_preload_pages > 0:
+            self._spawn(self._preload_users())
+        for index in range(self._notify_queue.workers):
+            self._spawn(self._notify_queue.run_worker(index))
+
+    def _forum_entries(self, cfg: Config) -> List[dict]:
+        """forums 未配置时，顶层 xf_url / xf_api_key / watch_groups 作为唯一的 default 站点"""
+        if not cfg.forums:
+            return [{
+                "name": "default",
+                "xf_url": cfg.xf_url,
+                "xf_api_key": cfg.xf_api_key,
+                "watch_groups": cfg.watch_groups,
+            }]
+        entries, seen = [], set()
+        for index, entry in enumerate(cfg.forums, 1):
+            name = str(entry.get("name") or f"forum{index}").strip()
+            if name in seen:
+                logger.warning(f"[XenForo] forums 中站点名 {name} 重复，第 {index} 个改名为 {name}_{index}")
+                name = f"{name}_{index}"
+            seen.add(name)
+            entries.append({**entry, "name": name})
+        return entries
+
+    def _apply_cfg(self, cfg: Config) -> None:
+        """按新配置调整站点、限流和模板，全部完成后才替换 self.cfg"""
+        forums: Dict[str, ForumBackend] = {}
+        for entry in self._forum_entries(cfg):
+            forum = self._forums.get(entry["name"]) or ForumBackend(entry["name"], self._data_dir, self._metrics)
+            forum.configure(entry, cfg)
+            forums[forum.name] = forum
+        # 从配置里删掉的站点：合并完索引后关闭连接池
+        for name, forum in self._forums.items():
+            if name not in forums:
+                self._spawn(self._retire_forum(forum))
+        self._forums = forums
+
+        group_forums: Dict[str, str] = {}
+        for forum in forums.values():
+            for group_id in forum.groups:
+                if group_id in group_forums:
+                    logger.warning(f"[XenForo] 群 {group_id} 同时绑定了 {group_forums[group_id]} 和 {forum.name}，使用前者")
+                    continue
+                group_forums[group_id] = forum.name
+        self._group_forums = group_forums
+        # 没有绑定群的站点作为默认站点；都绑定了群时取第一个
+        self._default_forum = next((f.name for f in forums.values() if not f.groups), next(iter(forums)))
+
+        self._disk_cache.max_age = max(60, cfg.cache_persist_max_age)
+        self._disk_cache.max_entries = max(1, cfg.cache_persist_max_entries)
+        self._command_limiter.configure(cfg.command_window)
+        self._notify_seen.resize(cfg.notify_dedupe_max_entries)
+        self._send_scheduler.configure(cfg.send_rate, cfg.send_burst, cfg.send_group_interval)
+        self._notify_coalescer.window = max(0, cfg.notify_coalesce_window)
+        self._notify_coalescer.max_items = max(1, cfg.notify_digest_max_items)
+        # 模板和站点地址都会进入渲染结果，重新编译时一并清掉已渲染的片段
+        self._templates.configure(cfg.reply_templates)
+        self.cfg = cfg
+
+    async def _retire_forum(self, forum: ForumBackend) -> None:
+        try:
+            await self._compact_search_index(forum)
+            await forum.close()
+        except Exception as e:
+            logger.error(f"[XenForo] 关闭站点 {forum.name} 失败: {e}")
+        logger.info(f"[XenForo] 站点 {forum.name} 已从配置中移除")
 
-    def _normalize_text(self, text: str) -> str:
-        return text.lstrip("/").strip()
+    def _route_forum(self, group_id: str) -> str:
+        return self._group_forums.get(group_id, self._default_forum)
 
     def _is_slash_message(self, text: str) -> bool:
         text = (text or "").lstrip()
         return text.startswith("/") or text.startswith("／")
 
     def _ensure_ready(self) -> Optional[str]:
-        self._refresh_cfg()
-        if not self.xf_url:
-            return f"请先配置 XenForo 站点地址：{self._cfg_path} 里的 xf_url"
-        if not self.xf_api_key:
-            return f"请先配置 XenForo API 密钥：{self._cfg_path} 里的 xf_api_key"
+        self._start_background_tasks()
+        forum = self._forum
+        forum.last_command_at = time.monotonic()
+        where = f"forums 中 {forum.name} 的" if self.cfg.forums else "里的"
+        if not forum.xf_url:
+            return f"请先配置 XenForo 站点地址：{self._cfg_path} {where} xf_url"
+        if not forum.xf_api_key:
+            return f"请先配置 XenForo API 密钥：{self._cfg_path} {where} xf_api_key"
         return None
 
-    def _headers(self) -> dict:
-        return {
-            "XF-Api-Key": self.xf_api_key,
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-        }
-
     def _abs_url(self, maybe_url: str) -> str:
         if not maybe_url:
             return ""
         if maybe_url.startswith("http://") or maybe_url.startswith("https://"):
             return maybe_url
-        return urljoin(self.xf_url + "/", maybe_url.lstrip("/"))
+        return urljoin(self._forum.xf_url + "/", maybe_url.lstrip("/"))
 
     def _format_http_error(self, status_code: int) -> str:
         if status_code in (401, 403):
@@ -191,233 +2988,621 @@ class Main(Star):
             return "请求过于频繁(429)：请稍后再试"
         return f"API错误: {status_code}"
 
+    def _cache_key(self, path: str, params: Optional[dict]) -> tuple:
+        return (path, tuple(sorted((params or {}).items())))
+
+    def _cache_ttl(self, path: str) -> float:
+        endpoint = path[len("/api/"):] if path.startswith("/api/") else path.lstrip("/")
+        ttl = self.cfg.cache_ttl.get(endpoint)
+        if ttl is None:
+            ttl = self.cfg.cache_ttl.get(Metrics.endpoint(endpoint), 0)
+        return float(ttl or 0)
+
+    async def _api_get(self, path: str, params: Optional[dict] = None) -> Tuple[Optional[dict], Optional[str]]:
+        """请求 XenForo API（带缓存），返回 (数据, 错误信息)
+
+        缓存过期但仍在 cache_stale_ttl 宽限期内时直接返回旧数据，
+        同时在后台发起一次刷新。
+        """
+        ttl = self._cache_ttl(path)
+        if ttl <= 0:
+            return await self._api_fetch(path, params)
+
+        key = self._cache_key(path, params)
+        endpoint = Metrics.endpoint(path)
+        hit = self._forum.cache.get(key)
+        if hit is None and self.cfg.cache_persist and key not in self._forum.disk_checked:
+            hit = await self._load_persisted(key)
+        if hit is not None:
+            data, age = hit
+            if age < ttl:
+                self._metrics.inc("cache_requests_total", endpoint=endpoint, result="hit", forum=self._forum.name)
+                return data, None
+            if age < ttl + self.cfg.cache_stale_ttl:
+                self._metrics.inc("cache_requests_total", endpoint=endpoint, result="stale", forum=self._forum.name)
+                if key not in self._forum.revalidating:
+                    self._forum.revalidating.add(key)
+                    self._spawn(self._revalidate(key, path, params))
+                return data, None
+
+        self._metrics.inc("cache_requests_total", endpoint=endpoint, result="miss", forum=self._forum.name)
+        data, err = await self._api_fetch(path, params)
+        if err is None and not self._is_stale(data):
+            self._cache_store(key, data)
+        return data, err
+
+    def _cache_store(self, key: tuple, data) -> None:
+        self._forum.cache.set(key, data)
+        if self.cfg.cache_persist:
+            self._disk_cache.put(self._forum.xf_url, key, data)
+
+    async def _load_persisted(self, key: tuple) -> Optional[Tuple[Any, float]]:
+        """从磁盘缓存恢复一个键；并发的相同查询只读一次盘，结果同时作为论坛不可用时的备用数据"""
+        site = self._forum.xf_url
+        try:
+            hit = await self._forum.inflight.do(("disk",) + key, lambda: asyncio.to_thread(self._disk_cache.get, site, key))
+        except Exception as e:
+            logger.warning(f"[XenForo] 读取磁盘缓存失败: {e}")
+            hit = None
+        # 并发等待者里只有第一个负责回填内存缓存
+        first = key not in self._forum.disk_checked
+        self._forum.disk_checked.add(key)
+        if hit is None or site != self._forum.xf_url:
+            return None
+        data, age = hit
+        if first:
+            self._metrics.inc("cache_disk_loads_total", forum=self._forum.name)
+            self._forum.cache.set(key, data, age=age)
+            if self._forum.last_good.get(key) is None:
+                self._forum.last_good.set(key, data, age=age)
+        return data, age
+
+    async def _disk_cache_loop(self) -> None:
+        """定期把新的响应批量写盘，并按 cache_persist_compact_interval 清理过期记录"""
+        compacted_at = time.monotonic()
+        while True:
+            await asyncio.sleep(5)
+            if not self.cfg.cache_persist:
+                continue
+            try:
+                await asyncio.to_thread(self._disk_cache.flush, self._disk_cache.take())
+                if time.monotonic() - compacted_at >= self.cfg.cache_persist_compact_interval:
+                    compacted_at = time.monotonic()
+                    sites = tuple(forum.xf_url for forum in self._forums.values())
+                    removed = await asyncio.to_thread(self._disk_cache.compact, sites)
+                    if removed:
+                        logger.info(f"[XenForo] 磁盘缓存已清理 {removed} 条过期记录")
+            except Exception as e:
+                logger.error(f"[XenForo] 写入磁盘缓存失败: {e}")
+
+    async def _revalidate(self, key: tuple, path: str, params: Optional[dict]) -> None:
+        try:
+            data, err = await self._api_fetch(path, params, fallback=False)
+            if err is None:
+                self._cache_store(key, data)
+            else:
+                logger.warning(f"[XenForo] 后台刷新缓存失败 {path}: {err}")
+        finally:
+            self._forum.revalidating.discard(key)
+
+    async def _api_fetch(
+        self, path: str, params: Optional[dict] = None, fallback: bool = True
+    ) -> Tuple[Optional[dict], Optional[str]]:
+        """请求 XenForo API，并发的相同请求共用同一次上游调用
+
+        论坛不可用（熔断、超时、429/5xx）时，若有该端点上次成功的数据，
+        则返回它并用 STALE_KEY 标记缓存时长。
+        """
+        key = self._cache_key(path, params)
+        data, err, degraded = await self._forum.inflight.do(key, lambda: self._api_request(path, params))
+        if err is None:
+            self._forum.last_good.set(key, data)
+            self._observe(path, data)
+            return data, None
+        if fallback and degraded:
+            hit = self._forum.last_good.get(key)
+            if hit is not None and isinstance(hit[0], dict):
+                logger.warning(f"[XenForo] {path} 请求失败，返回缓存数据: {err}")
+                self._metrics.inc("stale_fallbacks_total", forum=self._forum.name)
+                return {**hit[0], STALE_KEY: hit[1]}, None
+        return None, err
+
+    async def _api_request(self, path: str, params: Optional[dict] = None) -> Tuple[Optional[dict], Optional[str], bool]:
+        """直接请求 XenForo API，返回 (数据, 错误信息, 是否属于论坛不可用)"""
+        forum = self._forum
+        try:
+            status, body = await forum.get(path, params=params, wait=forum.client.timeout)
+        except CircuitOpenError:
+            return None, "论坛暂时无法访问，请稍后再试", True
+        except ForumBusyError:
+            return None, "论坛请求繁忙，请稍后再试", True
+        except asyncio.TimeoutError:
+            return None, f"请求失败: 请求超时({self.cfg.request_timeout}s)", True
+        except Exception as e:
+            return None, f"请求失败: {e}", True
+
+        if status != 200:
+            return None, self._format_http_error(status), status == 429 or status >= 500
+
+        try:
+            data = project_payload(json_loads(body))
+        except Exception as e:
+            return None, f"解析返回失败: {e}", False
+        return data, None, False
+
+    def _observe(self, path: str, data) -> None:
+        """从新拿到的接口数据中增量更新本地索引"""
+        if not isinstance(data, dict):
+            return
+        if path == "/api/threads":
+            threads = data.get("threads") or []
+            self._forum.hot_index.update(threads)
+            for thread in threads:
+                self._index_thread(thread)
+        elif path.startswith("/api/threads/") and isinstance(data.get("thread"), RECORD_TYPES):
+            self._forum.hot_index.update([data["thread"]])
+            self._index_thread(data["thread"])
+        elif path == "/api/posts":
+            for post in data.get("posts") or []:
+                if post.get("is_first_post") and isinstance(post.get("Thread"), RECORD_TYPES):
+                    self._index_thread(post["Thread"], post.get("message", ""))
+        elif path == "/api/users/find-name":
+            self._forum.user_index.add(data.get("exact"))
+            for user in data.get("recommendations") or []:
+                self._forum.user_index.add(user, complete=False)
+        elif path == "/api/users":
+            for user in data.get("users") or []:
+                self._forum.user_index.add(user)
+
+    def _index_thread(self, thread: dict, text: str = "") -> None:
+        """写入全文索引；带首帖（with_first_post）时连同首帖正文一起索引"""
+        try:
+            first_post = thread.get("FirstPost")
+            if not text and isinstance(first_post, RECORD_TYPES):
+                text = first_post.get("message", "")
+            self._forum.search_index.add(int(thread.get("thread_id") or 0), thread.get("title", ""), text)
+        except (TypeError, ValueError):
+            pass
+
+    async def _search_compact_loop(self) -> None:
+        """增量索引积累到 search_compact_docs 条或超过 search_compact_interval 秒时合并到磁盘"""
+        while True:
+            await asyncio.sleep(30)
+            for forum in list(self._forums.values()):
+                index = forum.search_index
+                if not index.pending:
+                    continue
+                if index.pending < self.cfg.search_compact_docs and (
+                    time.monotonic() - index.compacted_at < self.cfg.search_compact_interval
+                ):
+                    continue
+                await self._compact_search_index(forum)
+
+    async def _compact_search_index(self, forum: ForumBackend) -> None:
+        index = forum.search_index
+        if index.compacting or not index.pending or not index.site:
+            return
+        delta, site = index.snapshot()
+        job = asyncio.ensure_future(asyncio.to_thread(index.compact, delta, site))
+
+        def finish(job: asyncio.Future) -> None:
+            # 等线程真正结束再收尾，等待方被取消（如插件关闭）也不会提前关闭它正在读的 mmap
+            merged = not job.cancelled() and job.exception() is None and job.result()
+            index.finish_compact(delta if merged else {})
+            forum.search_compaction = None
+
+        job.add_done_callback(finish)
+        forum.search_compaction = job
+        try:
+            if await asyncio.shield(job):
+                logger.info(f"[XenForo] 搜索索引已合并 {len(delta)} 个主题，共 {len(index)} 个")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[XenForo] 合并搜索索引失败: {e}")
+
+    def _search_threads_text(self, query: str) -> str:
+        results = self._forum.search_index.search(query, max(1, self.cfg.search_results))
+        if not results:
+            return f"本地索引中没有找到与「{query}」相关的主题（已索引 {len(self._forum.search_index)} 个主题）"
+        group_id = REPLY_GROUP.get()
+        parts = [self._templates.render("search_header", {"query": query, "count": len(results)}, group_id)]
+        for thread_id, title in results:
+            values = {"title": title, "thread_id": thread_id, "url": f"{self._forum.xf_url}/threads/{thread_id}/"}
+            parts.append(self._templates.render("search_item", values, group_id))
+        return "".join(parts)
+
+    def _is_stale(self, data) -> bool:
+        return isinstance(data, dict) and STALE_KEY in data
+
+    def _stale_notice(self, data) -> str:
+        if not self._is_stale(data):
+            return ""
+        age = int(data[STALE_KEY])
+        age_text = f"{age} 秒" if age < 60 else f"{age // 60} 分钟"
+        return f"\n⚠️ 论坛暂时无法访问，以上为 {age_text}前的缓存数据\n"
+
     def _format_timestamp(self, timestamp) -> str:
         """将Unix时间戳转换为可读的日期时间格式"""
         try:
             if timestamp is None:
                 return "未知"
-            dt = datetime.fromtimestamp(int(timestamp))
-            return dt.strftime("%Y年%m月%d日 %H:%M:%S")
+            return format_timestamp(int(timestamp))
         except Exception as e:
             logger.warning(f"[XenForo] 时间戳转换失败: {timestamp}, 错误: {e}")
             return str(timestamp)
 
-    def _fetch_latest_threads_text(self, limit: int = 5) -> str:
-        try:
-            response = requests.get(
-                f"{self.xf_url}/api/threads",
-                headers=self._headers(),
-                params={"limit": limit},
-                timeout=self.cfg.request_timeout,
-            )
-        except Exception as e:
-            return f"请求失败: {e}"
+    async def _iter_pages(
+        self, path: str, params: Optional[dict] = None, max_items: int = 0
+    ) -> AsyncIterator[Tuple[Optional[dict], Optional[str]]]:
+        """逐页遍历列表接口，产出 (数据, 错误信息)
+
+        首页返回后根据 pagination 并发预取后续页，同时在途的最多 list_prefetch 页，
+        按页序产出；max_items 大于 0 时只拉取凑够这么多条所需的页数。
+        """
+        params = dict(params or {})
+        data, err = await self._api_get(path, params)
+        yield data, err
+        if err or not isinstance(data, dict):
+            return
 
-        if response.status_code != 200:
-            return self._format_http_error(response.status_code)
+        pagination = data.get("pagination") or {}
+        last_page = min(int(pagination.get("last_page") or 1), max(1, self.cfg.list_max_pages))
+        per_page = int(pagination.get("per_page") or 0)
+        if max_items and per_page:
+            last_page = min(last_page, math.ceil(max_items / per_page))
 
+        pending: deque = deque()
+        next_page = 2
+
+        def schedule() -> None:
+            nonlocal next_page
+            while next_page <= last_page and len(pending) < max(1, self.cfg.list_prefetch):
+                pending.append(asyncio.ensure_future(self._api_get(path, {**params, "page": next_page})))
+                next_page += 1
+
+        schedule()
         try:
-            data = response.json()
-        except Exception as e:
-            return f"解析返回失败: {e}"
+            while pending:
+                data, err = await pending.popleft()
+                if not err:
+                    schedule()
+                yield data, err
+                if err:
+                    return
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _stream_list(
+        self, path: str, params: Optional[dict], list_key: str, header: str, empty_text: str,
+        render_item: Callable[[dict], str], limit: int = 0,
+    ) -> AsyncIterator[str]:
+        """流式输出列表：边翻页边渲染，每攒够 reply_chunk_size 个字符就产出一条消息"""
+        chunker = ReplyChunker(max(200, self.cfg.reply_chunk_size))
+        count = 0
+        stale_data = None
+        async with contextlib.aclosing(self._iter_pages(path, params, max_items=limit)) as pages:
+            async for data, err in pages:
+                if err:
+                    if not count:
+                        yield err
+                        return
+                    chunk = chunker.add(f"⚠️ 后续内容加载失败: {err}\n")
+                    if chunk:
+                        yield chunk
+                    break
+                if self._is_stale(data):
+                    stale_data = data
+                items = data.get(list_key, []) if isinstance(data, dict) else []
+                if limit:
+                    items = items[: limit - count]
+                for item in items:
+                    if not count:
+                        chunk = chunker.add(header)
+                        if chunk:
+                            yield chunk
+                    count += 1
+                    chunk = chunker.add(render_item(item))
+                    if chunk:
+                        yield chunk
+                if limit and count >= limit:
+                    break
+
+        if not count:
+            yield empty_text
+            return
+        if stale_data is not None:
+            chunk = chunker.add(self._stale_notice(stale_data))
+            if chunk:
+                yield chunk
+        rest = chunker.flush()
+        if rest:
+            yield rest
+
+    async def _stream_latest_threads(self, limit: int = 5) -> AsyncIterator[str]:
+        """最新主题列表，按消息长度分段产出"""
+        params = {"limit": limit}
+        text = self._get_prerendered("/api/threads", params)
+        if text is not None:
+            yield text
+            return
+        async for chunk in self._stream_list(
+            "/api/threads", params, "threads", self._templates.render("thread_header", {}, REPLY_GROUP.get()),
+            "暂无主题", self._render_thread_item, limit,
+        ):
+            yield chunk
+
+    async def _fetch_latest_threads_text(self, limit: int = 5) -> str:
+        return "".join([chunk async for chunk in self._stream_latest_threads(limit)])
+
+    def _render_item(self, name: str, key: Optional[tuple], values: Callable[[dict], dict], record: dict) -> str:
+        """按当前群的模板渲染一条记录；片段缓存按站点区分，不同站点的相同 ID 不会串"""
+        if key is not None:
+            key = (self._forum.name,) + key
+        return self._templates.render_item(name, key, values, record, REPLY_GROUP.get())
+
+    def _thread_key(self, t: dict) -> Optional[tuple]:
+        # 浏览数不会改变最后回复时间，也算进版本里
+        if not t.get("thread_id"):
+            return None
+        return t["thread_id"], t.get("last_post_date"), t.get("reply_count"), t.get("view_count"), t.get("title")
+
+    def _thread_values(self, t: dict) -> dict:
+        thread_id = t.get("thread_id", "")
+        post_date = t.get("post_date")
+        return {
+            "thread_id": thread_id,
+            "title": t.get("title", "无标题"),
+            "username": t.get("username", "未知"),
+            "reply_count": t.get("reply_count", 0),
+            "view_count": t.get("view_count", 0),
+            "post_date": self._format_timestamp(post_date) if post_date else "",
+            "url": f"{self._forum.xf_url}/threads/{thread_id}/",
+        }
+
+    def _render_thread_item(self, t: dict) -> str:
+        return self._render_item("thread_item", self._thread_key(t), self._thread_values, t)
 
+    def _render_latest_threads(self, data: dict, limit: int) -> str:
         threads = data.get("threads", [])
         if not threads:
             return "暂无主题"
 
-        msg = "📌 最新主题：\n\n"
-        for t in threads[:limit]:
-            thread_id = t.get("thread_id", "")
-            msg += f"• {t.get('title', '无标题')}\n"
-            msg += f"  作者: {t.get('username', '未知')}\n"
-            msg += f"  {self.xf_url}/threads/{thread_id}/\n\n"
-        return msg
-
-    def _fetch_thread_detail_text(self, thread_id: str) -> str:
-        """获取主题详情"""
-        try:
-            response = requests.get(
-                f"{self.xf_url}/api/threads/{thread_id}",
-                headers=self._headers(),
-                timeout=self.cfg.request_timeout,
-            )
-        except Exception as e:
-            return f"请求失败: {e}"
+        parts = [self._templates.render("thread_header", {}, REPLY_GROUP.get())]
+        parts.extend(self._render_thread_item(t) for t in threads[:limit])
+        parts.append(self._stale_notice(data))
+        return "".join(parts)
 
-        if response.status_code != 200:
-            return self._format_http_error(response.status_code)
+    async def _fetch_thread_detail_text(self, thread_id: str) -> str:
+        """获取主题详情，附带首帖摘要、最新回复和板块路径
 
+        本地索引里有这个主题时，按记录算出回复的最后一页和板块 ID，与主题请求同时发出；
+        没有记录或推算不对时，等主题返回后再补发。主题返回后附加请求最多再等 thread_detail_deadline 秒
+        （默认不等，总耗时与只查主题相同），没赶上的部分省略不显示，请求在后台完成后进入缓存，下次直接用上。
+        """
+        path = f"/api/threads/{thread_id}"
         try:
-            data = response.json()
-        except Exception as e:
-            return f"解析返回失败: {e}"
+            known = self._forum.hot_index.get(int(thread_id))
+        except ValueError:
+            known = None
+
+        extras: Dict[str, asyncio.Task] = {}
+        posts_page = self._last_posts_page(known) if known is not None else None
+        if self.cfg.thread_detail_replies > 0 and posts_page is not None:
+            extras["replies"] = self._spawn(self._api_get(f"{path}/posts", {"page": posts_page}))
+        if self.cfg.thread_detail_breadcrumbs and not self._forum.thread_has_forum and known and known.get("node_id"):
+            extras["breadcrumbs"] = self._spawn(self._api_get(f"/api/forums/{known['node_id']}"))
+
+        params = {"with_first_post": 1} if self.cfg.thread_detail_excerpt > 0 else None
+        data, err = await self._api_get(path, params)
+        if err:
+            return err
 
         thread = data.get("thread", {})
         if not thread:
             return f"未找到主题 ID: {thread_id}"
 
-        msg = "📄 主题详情\n\n"
-        msg += f"标题: {thread.get('title', '无标题')}\n"
-        msg += f"作者: {thread.get('username', '未知')}\n"
-        msg += f"回复数: {thread.get('reply_count', 0)}\n"
-        msg += f"浏览数: {thread.get('view_count', 0)}\n"
-        
-        post_date = thread.get('post_date')
-        if post_date:
-            msg += f"发布时间: {self._format_timestamp(post_date)}\n"
-        
-        msg += f"\n{self.xf_url}/threads/{thread_id}/\n"
-        
-        return msg
-
-    def _fetch_latest_posts_text(self, limit: int = 5) -> str:
-        """获取最新回复"""
+        # 本地没有记录或记录过时：按主题返回的数据补发
+        if self.cfg.thread_detail_replies > 0 and self._last_posts_page(thread) != posts_page:
+            extras["replies"] = self._spawn(self._api_get(f"{path}/posts", {"page": self._last_posts_page(thread)}))
+        forum = thread.get("Forum") if isinstance(thread.get("Forum"), RECORD_TYPES) else None
+        self._forum.thread_has_forum = forum is not None
+        if self.cfg.thread_detail_breadcrumbs and "breadcrumbs" not in extras:
+            if forum is None and thread.get("node_id"):
+                extras["breadcrumbs"] = self._spawn(self._api_get(f"/api/forums/{thread['node_id']}"))
+
+        # 已缓存的附加内容不会真正等待；超时为 0 时也会先让刚启动的任务跑一轮
+        pending = [task for task in extras.values() if not task.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=max(0.0, self.cfg.thread_detail_deadline))
+        results = {}
+        for name, task in extras.items():
+            if task.done() and not task.cancelled() and task.exception() is None:
+                results[name] = task.result()
+
+        group_id = REPLY_GROUP.get()
+        parts = [self._render_item("thread_detail", self._thread_key(thread), self._thread_values, thread)]
+        if self.cfg.thread_detail_breadcrumbs:
+            forum_data, forum_err = results.get("breadcrumbs", (None, None))
+            if forum is None and isinstance(forum_data, dict) and not forum_err:
+                forum = forum_data.get("forum")
+            crumbs = self._breadcrumbs(forum)
+            if crumbs:
+                parts.append(self._templates.render("thread_breadcrumbs", {"breadcrumbs": crumbs}, group_id))
+        first_post = thread.get("FirstPost")
+        if self.cfg.thread_detail_excerpt > 0 and isinstance(first_post, RECORD_TYPES):
+            excerpt = self._excerpt(first_post.get("message", ""), self.cfg.thread_detail_excerpt)
+            if excerpt:
+                parts.append(self._templates.render("thread_excerpt", {"excerpt": excerpt}, group_id))
+        replies, replies_err = results.get("replies", (None, None))
+        if isinstance(replies, dict) and not replies_err:
+            parts.append(self._render_thread_replies(replies, group_id))
+
+        labels = {"replies": "最新回复", "breadcrumbs": "板块路径"}
+        missing = [label for name, label in labels.items() if name in extras and name not in results]
+        if missing and self.cfg.thread_detail_deadline > 0:
+            parts.append(f"\n⏱️ {'、'.join(missing)}加载较慢，已省略\n")
+        elif missing:
+            # 没有等待附加内容，不是论坛慢；后台请求完成后进入缓存
+            parts.append(f"\nℹ️ {'、'.join(missing)}稍后再次查询可显示\n")
+        parts.append(self._stale_notice(data))
+        return "".join(parts)
+
+    def _last_posts_page(self, thread: dict) -> int:
+        """由回复数推算帖子列表的最后一页（首帖也占一个位置）"""
         try:
-            response = requests.get(
-                f"{self.xf_url}/api/posts",
-                headers=self._headers(),
-                params={"limit": limit},
-                timeout=self.cfg.request_timeout,
-            )
-        except Exception as e:
-            return f"请求失败: {e}"
+            posts = int(thread.get("reply_count") or 0) + 1
+        except (TypeError, ValueError):
+            return 1
+        return max(1, math.ceil(posts / self._forum.posts_per_page))
 
-        if response.status_code != 200:
-            return self._format_http_error(response.status_code)
+    def _breadcrumbs(self, forum: Optional[dict]) -> str:
+        if not isinstance(forum, RECORD_TYPES):
+            return ""
+        titles = [crumb.get("title", "") for crumb in forum.get("breadcrumbs") or [] if isinstance(crumb, dict)]
+        titles.append(forum.get("title", ""))
+        return " › ".join(title for title in titles if title)
+
+    def _excerpt(self, message: str, length: int) -> str:
+        text = " ".join(ThreadSearchIndex.BBCODE_RE.sub(" ", message or "").split())
+        return text if len(text) <= length else text[:length].rstrip() + "…"
+
+    def _render_thread_replies(self, data: dict, group_id: str) -> str:
+        pagination = data.get("pagination") or {}
+        if pagination.get("per_page"):
+            self._forum.posts_per_page = max(1, int(pagination["per_page"]))
+        posts = [p for p in data.get("posts") or [] if isinstance(p, RECORD_TYPES) and not p.get("is_first_post")]
+        posts = posts[-self.cfg.thread_detail_replies:]
+        if not posts:
+            return ""
+        parts = [self._templates.render("thread_reply_header", {}, group_id)]
+        for p in posts:
+            values = {"username": p.get("username", "未知"), "excerpt": self._excerpt(p.get("message", ""), 60)}
+            parts.append(self._templates.render("thread_reply_item", values, group_id))
+        return "".join(parts)
 
-        try:
-            data = response.json()
-        except Exception as e:
-            return f"解析返回失败: {e}"
+    async def _fetch_latest_posts_text(self, limit: int = 5) -> str:
+        """获取最新回复"""
+        params = {"limit": limit}
+        text = self._get_prerendered("/api/posts", params)
+        if text is not None:
+            return text
+
+        data, err = await self._api_get("/api/posts", params)
+        if err:
+            return err
+        return self._render_latest_posts(data, limit)
 
+    def _render_latest_posts(self, data: dict, limit: int) -> str:
         posts = data.get("posts", [])
         if not posts:
             return "暂无回复"
 
-        msg = "💬 最新回复：\n\n"
+        group_id = REPLY_GROUP.get()
+        parts = [self._templates.render("post_header", {}, group_id)]
         for p in posts[:limit]:
-            thread_id = p.get("thread_id", "")
-            post_id = p.get("post_id", "")
-            msg += f"• 主题: {p.get('Thread', {}).get('title', '无标题')}\n"
-            msg += f"  回复者: {p.get('username', '未知')}\n"
-            if thread_id:
-                msg += f"  {self.xf_url}/threads/{thread_id}/#post-{post_id}\n\n"
-            else:
-                msg += "\n"
-        return msg
+            key = (p["post_id"], p.get("last_edit_date"), (p.get("Thread") or {}).get("title")) if p.get("post_id") else None
+            parts.append(self._render_item("post_item", key, self._post_values, p))
+        parts.append(self._stale_notice(data))
+        return "".join(parts)
 
-    def _fetch_forum_stats_text(self) -> str:
-        """获取论坛统计信息"""
-        try:
-            response = requests.get(
-                f"{self.xf_url}/api/index",
-                headers=self._headers(),
-                timeout=self.cfg.request_timeout,
-            )
-        except Exception as e:
-            return f"请求失败: {e}"
+    def _post_values(self, p: dict) -> dict:
+        thread_id = p.get("thread_id", "")
+        return {
+            "post_id": p.get("post_id", ""),
+            "thread_id": thread_id,
+            "thread_title": (p.get("Thread") or {}).get("title", "无标题"),
+            "username": p.get("username", "未知"),
+            "url": f"{self._forum.xf_url}/threads/{thread_id}/#post-{p.get('post_id', '')}" if thread_id else "",
+        }
 
-        if response.status_code != 200:
-            return self._format_http_error(response.status_code)
+    async def _fetch_forum_stats_text(self) -> str:
+        """获取论坛统计信息"""
+        text = self._get_prerendered("/api/index", None)
+        if text is not None:
+            return text
 
-        try:
-            data = response.json()
-        except Exception as e:
-            return f"解析返回失败: {e}"
+        data, err = await self._api_get("/api/index")
+        if err:
+            return err
+        return self._render_forum_stats(data)
 
-        msg = "📊 论坛统计\n\n"
-        
-        # 从返回数据中提取统计信息
+    def _render_forum_stats(self, data: dict) -> str:
+        # 从返回数据中提取统计信息；模板里没有值的行会省略
         if "boardStats" in data:
             stats = data["boardStats"]
-            msg += f"总主题数: {stats.get('messages', 0):,}\n"
-            msg += f"总用户数: {stats.get('members', 0):,}\n"
-            if "latestMember" in stats:
-                msg += f"最新用户: {stats['latestMember'].get('username', '未知')}\n"
+            values = {
+                "messages": stats.get("messages", 0),
+                "users": stats.get("members", 0),
+                "latest_member": (stats.get("latestMember") or {}).get("username", ""),
+            }
         elif "statistics" in data:
             stats = data["statistics"]
-            msg += f"总主题数: {stats.get('threads', 0):,}\n"
-            msg += f"总回复数: {stats.get('messages', 0):,}\n"
-            msg += f"总用户数: {stats.get('users', 0):,}\n"
+            values = {
+                "threads": stats.get("threads", 0),
+                "messages": stats.get("messages", 0),
+                "users": stats.get("users", 0),
+            }
         else:
-            msg += "统计信息不可用"
-        
-        return msg
-
-    def _fetch_forums_list_text(self) -> str:
-        """获取板块列表"""
-        try:
-            response = requests.get(
-                f"{self.xf_url}/api/forums",
-                headers=self._headers(),
-                timeout=self.cfg.request_timeout,
-            )
-        except Exception as e:
-            return f"请求失败: {e}"
+            return "📊 论坛统计\n\n统计信息不可用" + self._stale_notice(data)
 
-        if response.status_code != 200:
-            return self._format_http_error(response.status_code)
+        return self._templates.render("forum_stats", values, REPLY_GROUP.get()) + self._stale_notice(data)
 
-        try:
-            data = response.json()
-        except Exception as e:
-            return f"解析返回失败: {e}"
-
-        forums = data.get("forums", [])
-        if not forums:
-            return "暂无板块"
-
-        msg = "📁 板块列表：\n\n"
-        for f in forums:
-            forum_id = f.get("node_id", "")
-            msg += f"• {f.get('title', '无标题')}\n"
-            msg += f"  ID: {forum_id}\n"
-            msg += f"  主题数: {f.get('discussion_count', 0)}\n"
-            msg += f"  {self.xf_url}/forums/{forum_id}/\n\n"
-        return msg
+    async def _stream_forums_list(self) -> AsyncIterator[str]:
+        """板块列表，逐页拉取并按消息长度分段产出"""
+        async for chunk in self._stream_list(
+            "/api/forums", None, "forums", self._templates.render("forum_header", {}, REPLY_GROUP.get()),
+            "暂无板块", self._render_forum_item,
+        ):
+            yield chunk
 
-    def _fetch_hot_threads_text(self, limit: int = 5) -> str:
-        """获取热门主题"""
-        try:
-            response = requests.get(
-                f"{self.xf_url}/api/threads",
-                headers=self._headers(),
-                params={
-                    "limit": limit * 2,  # 获取更多再筛选
-                    "order": "reply_count"
-                },
-                timeout=self.cfg.request_timeout,
-            )
-        except Exception as e:
-            return f"请求失败: {e}"
+    async def _fetch_forums_list_text(self) -> str:
+        """获取板块列表"""
+        return "".join([chunk async for chunk in self._stream_forums_list()])
 
-        if response.status_code != 200:
-            return self._format_http_error(response.status_code)
+    def _render_forum_item(self, f: dict) -> str:
+        key = (f["node_id"], f.get("discussion_count"), f.get("title")) if f.get("node_id") else None
+        return self._render_item("forum_item", key, self._forum_values, f)
 
-        try:
-            data = response.json()
-        except Exception as e:
-            return f"解析返回失败: {e}"
+    def _forum_values(self, f: dict) -> dict:
+        forum_id = f.get("node_id", "")
+        return {
+            "node_id": forum_id,
+            "title": f.get("title", "无标题"),
+            "discussion_count": f.get("discussion_count", 0),
+            "url": f"{self._forum.xf_url}/forums/{forum_id}/",
+        }
 
-        threads = data.get("threads", [])
+    async def _fetch_hot_threads_text(self, limit: int = 5) -> str:
+        """获取热门主题（本地热度索引排序，索引过旧时先拉取最近活跃的主题）"""
+        if len(self._forum.hot_index) < limit or not self._forum.hot_index.is_fresh(self.cfg.hot_index_refresh):
+            err = await self._seed_hot_index()
+            if err and not len(self._forum.hot_index):
+                return err
+        return self._render_hot_threads(self._forum.hot_index.top(limit))
+
+    def _hot_seed_params(self, page: int) -> dict:
+        return {"order": "last_post_date", "direction": "desc", "page": page}
+
+    async def _seed_hot_index(self) -> Optional[str]:
+        """并发拉取最近活跃主题的前几页，数据经 _observe 写入热门索引"""
+        results = await asyncio.gather(*[
+            self._api_get("/api/threads", self._hot_seed_params(page))
+            for page in range(1, max(1, self.cfg.hot_seed_pages) + 1)
+        ])
+        errors = [err for _, err in results if err]
+        return errors[0] if len(errors) == len(results) else None
+
+    def _render_hot_threads(self, threads: list) -> str:
         if not threads:
             return "暂无热门主题"
 
-        # 按回复数排序
-        sorted_threads = sorted(
-            threads, 
-            key=lambda x: x.get('reply_count', 0), 
-            reverse=True
-        )
-
-        msg = "🔥 热门主题：\n\n"
-        for t in sorted_threads[:limit]:
-            thread_id = t.get("thread_id", "")
-            msg += f"• {t.get('title', '无标题')}\n"
-            msg += f"  作者: {t.get('username', '未知')}\n"
-            msg += f"  回复: {t.get('reply_count', 0)} | 浏览: {t.get('view_count', 0)}\n"
-            msg += f"  {self.xf_url}/threads/{thread_id}/\n\n"
-        return msg
+        group_id = REPLY_GROUP.get()
+        parts = [self._templates.render("hot_header", {}, group_id)]
+        for t in threads:
+            parts.append(self._render_item("hot_item", self._thread_key(t), self._thread_values, t))
+        return "".join(parts)
 
     def _get_help_text(self) -> str:
         """获取帮助信息"""
@@ -430,347 +3615,241 @@ class Main(Star):
         msg += "/热门 - 查看热门主题\n"
         msg += "/板块 - 查看所有板块列表\n"
         msg += "/统计 - 查看论坛统计数据\n"
+        msg += "/搜索 [关键词] - 搜索已浏览过的主题\n"
         msg += "/帮助 - 显示此帮助信息\n\n"
         msg += "💡 提示：所有命令也可以使用 /xf 前缀\n"
-        msg += "例如：/xf 论坛、/xf 用户 张三\n"
+        msg += "例如：/xf 论坛、/xf 用户 张三\n\n"
+        msg += "🔧 管理员：\n"
+        msg += "/xf 重载 - 重新加载配置文件\n"
+        msg += "/xf 状态 - 查看请求延迟、缓存命中率和队列状态\n"
         return msg
 
-    def _fetch_user_info_text(self, username: str) -> str:
-        try:
-            response = requests.get(
-                f"{self.xf_url}/api/users/find-name",
-                headers=self._headers(),
-                params={"username": username},
-                timeout=self.cfg.request_timeout,
-            )
-        except Exception as e:
-            return f"请求失败: {e}"
-
-        if response.status_code != 200:
-            return self._format_http_error(response.status_code)
-
-        try:
-            data = response.json()
-        except Exception as e:
-            return f"解析返回失败: {e}"
+    async def _preload_users(self) -> None:
+        """按 user_preload_pages 批量拉取用户列表写入用户名索引（需要 API Key 有 user:read 权限）"""
+        for forum in list(self._forums.values()):
+            if forum.ready:
+                with self._using_forum(forum):
+                    await self._preload_forum_users()
+
+    async def _preload_forum_users(self) -> None:
+        for page in range(1, self.cfg.user_preload_pages + 1):
+            data, err = await self._api_fetch("/api/users", {"page": page}, fallback=False)
+            if err:
+                logger.warning(f"[XenForo] 预加载用户列表失败: {err}")
+                return
+            pagination = data.get("pagination") or {}
+            if page >= int(pagination.get("last_page") or page):
+                break
+        logger.info(f"[XenForo] 用户名索引已预加载 {len(self._forum.user_index)} 个用户")
+
+    async def _fetch_user_info_text(self, username: str) -> str:
+        cached = self._forum.user_index.get(username, self.cfg.user_index_ttl)
+        if cached is not None:
+            return self._render_user(cached, username)
+
+        data, err = await self._api_get("/api/users/find-name", {"username": username})
+        if err:
+            return err
 
         user = data.get("exact")
         if not user:
-            return f"未找到用户: {username}"
+            msg = f"未找到用户: {username}"
+            suggestions = self._forum.user_index.suggest(username)
+            if suggestions:
+                msg += f"\n你是不是要找：{'、'.join(suggestions)}"
+            return msg
+
+        return self._render_user(user, username) + self._stale_notice(data)
 
-        msg = "👤 用户信息\n\n"
-        msg += f"用户名: {user.get('username', username)}\n"
+    def _render_user(self, user: dict, username: str) -> str:
+        key = None
         if user.get("user_id") is not None:
-            msg += f"用户ID: {user.get('user_id')}\n"
-        if user.get("register_date") is not None:
-            msg += f"注册时间: {self._format_timestamp(user.get('register_date'))}\n"
-        msg += f"帖子数: {user.get('message_count', 0)}\n"
-        msg += f"反应分: {user.get('reaction_score', 0)}\n"
+            key = (user["user_id"], user.get("username"), user.get("message_count"), user.get("reaction_score"))
+        return self._render_item("user", key, lambda u: self._user_values(u, username), user)
 
+    def _user_values(self, user: dict, username: str) -> dict:
         profile_url = user.get("view_url") or user.get("Profile")
-        profile_url = self._abs_url(profile_url) if isinstance(profile_url, str) else ""
-        if profile_url:
-            msg += f"\n{profile_url}\n"
-
-        return msg
-
-    @filter.command("论坛")
-    async def forum_cmd(self, event: AstrMessageEvent):
-        """获取最新帖子（兼容 /论坛）"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        try:
-            text = await asyncio.to_thread(
-                self._fetch_latest_threads_text,
-                limit=int(self.cfg.threads_limit or 5),
-            )
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取帖子失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-
-    @filter.command("用户")
-    async def user_cmd(self, event: AstrMessageEvent, username: str = ""):
-        """查询用户信息（/用户 用户名）"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        username = (username or "").strip()
-        if not username:
-            raw = self._normalize_text(event.message_str)
-            if raw.startswith("用户"):
-                username = raw[len("用户") :].strip()
-
-        if not username:
-            yield event.plain_result("请输入用户名，例如：/用户 张三")
-            return
-
-        try:
-            text = await asyncio.to_thread(self._fetch_user_info_text, username)
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 用户查询失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-    
-    @filter.command("主题")
-    async def thread_cmd(self, event: AstrMessageEvent, thread_id: str = ""):
-        """查看主题详情（/主题 ID）"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        thread_id = (thread_id or "").strip()
-        if not thread_id:
-            raw = self._normalize_text(event.message_str)
-            if raw.startswith("主题"):
-                thread_id = raw[len("主题") :].strip()
-
-        if not thread_id:
-            yield event.plain_result("请输入主题ID，例如：/主题 123")
-            return
-
-        try:
-            text = await asyncio.to_thread(self._fetch_thread_detail_text, thread_id)
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取主题失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-
-    @filter.command("回复")
-    async def posts_cmd(self, event: AstrMessageEvent):
-        """获取最新回复（/回复）"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        try:
-            text = await asyncio.to_thread(
-                self._fetch_latest_posts_text,
-                limit=5,
-            )
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取回复失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-
-    @filter.command("统计")
-    async def stats_cmd(self, event: AstrMessageEvent):
-        """获取论坛统计（/统计）"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        try:
-            text = await asyncio.to_thread(self._fetch_forum_stats_text)
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取统计失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-
-    @filter.command("板块")
-    async def forums_cmd(self, event: AstrMessageEvent):
-        """获取板块列表（/板块）"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        try:
-            text = await asyncio.to_thread(self._fetch_forums_list_text)
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取板块失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-
-    @filter.command("热门")
-    async def hot_cmd(self, event: AstrMessageEvent):
-        """获取热门主题（/热门）"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        try:
-            text = await asyncio.to_thread(
-                self._fetch_hot_threads_text,
-                limit=5,
-            )
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取热门主题失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-    
-    @filter.command("帮助")
-    async def help_cmd(self, event: AstrMessageEvent):
-        """显示帮助信息（/帮助）"""
-        try:
-            text = self._get_help_text()
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取帮助失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-    
-    @filter.command_group("xf")
-    def xf(self):
-        """XenForo 命令组"""
-        pass
-    
-    @xf.command("论坛")
-    async def forum(self, event: AstrMessageEvent):
-        """获取最新帖子"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
-
-        try:
-            text = await asyncio.to_thread(
-                self._fetch_latest_threads_text,
-                limit=int(self.cfg.threads_limit or 5),
-            )
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取帖子失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-    
-    @xf.command("用户")
-    async def user(self, event: AstrMessageEvent, username: str = ""):
-        """查询用户信息: xf 用户 用户名"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
+        register_date = user.get("register_date")
+        return {
+            "username": user.get("username", username),
+            "user_id": user.get("user_id"),
+            "register_date": self._format_timestamp(register_date) if register_date is not None else "",
+            "message_count": user.get("message_count", 0),
+            "reaction_score": user.get("reaction_score", 0),
+            "profile_url": self._abs_url(profile_url) if isinstance(profile_url, str) else "",
+        }
 
-        username = (username or "").strip()
-        if not username:
-            raw = self._normalize_text(event.message_str)
-            if raw.startswith("xf 用户"):
-                username = raw[len("xf 用户") :].strip()
-            elif raw.startswith("xf用户"):
-                username = raw[len("xf用户") :].strip()
-            elif raw.startswith("用户"):
-                username = raw[len("用户") :].strip()
-
-        if not username:
-            yield event.plain_result("请输入用户名，例如：/用户 张三")
+    def _build_commands(self) -> Dict[str, "CommandSpec"]:
+        """命令表：/xx 与 /xf xx 共用同一个处理函数"""
+        specs = [
+            CommandSpec("论坛", self._cmd_forum, "获取帖子失败"),
+            CommandSpec("用户", self._cmd_user, "用户查询失败", usage="请输入用户名，例如：/用户 张三"),
+            CommandSpec("主题", self._cmd_thread, "获取主题失败", usage="请输入主题ID，例如：/主题 123"),
+            CommandSpec("回复", self._cmd_posts, "获取回复失败"),
+            CommandSpec("统计", self._cmd_stats, "获取统计失败"),
+            CommandSpec("板块", self._cmd_forums, "获取板块失败"),
+            CommandSpec("热门", self._cmd_hot, "获取热门主题失败"),
+            CommandSpec("搜索", self._cmd_search, "搜索失败", usage="请输入关键词，例如：/搜索 插件"),
+            CommandSpec("帮助", self._cmd_help, "获取帮助失败", needs_api=False),
+            CommandSpec("重载", self._cmd_reload, "重新加载配置失败", needs_api=False, admin=True),
+            CommandSpec("状态", self._cmd_status, "获取状态失败", needs_api=False, admin=True),
+        ]
+        return {spec.name: spec for spec in specs}
+
+    def _compile_command_pattern(self) -> "re.Pattern":
+        # 可选的 xf 前缀 + 命令名 + 空白分隔的参数；命令名后必须是空白或结尾，避免“论坛好卡”被当成命令
+        names = "|".join(re.escape(name) for name in sorted(self._commands, key=len, reverse=True))
+        return re.compile(rf"(?:xf\s*)?({names})(?:\s+(.*))?", re.IGNORECASE | re.DOTALL)
+
+    def _match_command(self, event: AstrMessageEvent) -> Optional[Tuple["CommandSpec", str]]:
+        text = (event.message_str or "").strip()
+        # AstrBot 会去掉唤醒前缀 / 并标记 is_at_or_wake_command；全角 ／ 需要自己识别
+        woken = bool(getattr(event, "is_at_or_wake_command", False))
+        if self._is_slash_message(text):
+            woken = True
+            text = text[1:].lstrip()
+        if self.cfg.require_slash and not woken:
+            return None
+        if text.lower() == "xf":
+            return self._commands["帮助"], ""
+        match = self._command_re.fullmatch(text)
+        if match is None:
+            return None
+        return self._commands[match.group(1)], (match.group(2) or "").strip()
+
+    @filter.event_message_type(filter.EventMessageType.ALL)
+    async def on_message(self, event: AstrMessageEvent):
+        """命令分发：/论坛、/xf 论坛、／论坛 等写法都在这里解析"""
+        matched = self._match_command(event)
+        if matched is None:
             return
+        spec, arg = matched
+        event.stop_event()
 
+        # 按群号选择站点；之后的缓存、索引、连接池都是这个站点自己的
+        group_id = str(event.get_group_id() or "")
+        forum = CURRENT_FORUM.set(self._route_forum(group_id))
+        target = self._reply_target(event)
         try:
-            text = await asyncio.to_thread(self._fetch_user_info_text, username)
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 用户查询失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
-
-    @xf.command("主题")
-    async def thread(self, event: AstrMessageEvent, thread_id: str = ""):
-        """查看主题详情: xf 主题 ID"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
+            async for result in self._dispatch(event, spec, arg):
+                # 命令回复走高优先级通道，拿到发送时机后交给 AstrBot 发出
+                await self._send_scheduler.acquire(target, SendScheduler.INTERACTIVE)
+                yield result
+        finally:
+            with contextlib.suppress(ValueError):
+                CURRENT_FORUM.reset(forum)
+
+    @staticmethod
+    def _reply_target(event: AstrMessageEvent) -> str:
+        """回复对象：群聊为群号；私聊没有群号，按发送者区分，限流和缓存的回复都不会串到别人"""
+        return str(event.get_group_id() or "") or f"private:{event.get_sender_id()}"
+
+    async def _dispatch(self, event: AstrMessageEvent, spec: "CommandSpec", arg: str):
+        if spec.admin and not event.is_admin():
+            yield event.plain_result("该命令仅管理员可用")
             return
-
-        thread_id = (thread_id or "").strip()
-        if not thread_id:
-            raw = self._normalize_text(event.message_str)
-            if raw.startswith("xf 主题"):
-                thread_id = raw[len("xf 主题") :].strip()
-            elif raw.startswith("xf主题"):
-                thread_id = raw[len("xf主题") :].strip()
-            elif raw.startswith("主题"):
-                thread_id = raw[len("主题") :].strip()
-
-        if not thread_id:
-            yield event.plain_result("请输入主题ID，例如：/主题 123")
+        if spec.needs_api:
+            err = self._ensure_ready()
+            if err:
+                yield event.plain_result(err)
+                return
+        if spec.usage and not arg:
+            yield event.plain_result(spec.usage)
             return
 
+        group_id = str(event.get_group_id() or "")
+        reply_key = (self._forum.name, self._reply_target(event), spec.name, arg)
+        if spec.needs_api:
+            throttled = self._throttle(event, spec, reply_key)
+            if throttled is not None:
+                for text in throttled:
+                    yield event.plain_result(text)
+                return
+
+        started = time.monotonic()
+        failed = False
+        replies = []
+        source = REQUEST_SOURCE.set(spec.name)
+        group = REPLY_GROUP.set(group_id)
         try:
-            text = await asyncio.to_thread(self._fetch_thread_detail_text, thread_id)
-            yield event.plain_result(text)
+            async for text in spec.handler(arg):
+                replies.append(text)
+                yield event.plain_result(text)
         except Exception as e:
-            logger.error(f"[XenForo] 获取主题失败: {e}")
+            failed = True
+            logger.error(f"[XenForo] {spec.error_label}: {e}")
             yield event.plain_result(f"出错了: {str(e)}")
-
-    @xf.command("回复")
-    async def posts(self, event: AstrMessageEvent):
-        """获取最新回复: xf 回复"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
+        finally:
+            with contextlib.suppress(ValueError):
+                REQUEST_SOURCE.reset(source)
+            with contextlib.suppress(ValueError):
+                REPLY_GROUP.reset(group)
+            elapsed = time.monotonic() - started
+            spec.record(elapsed, failed)
+            if spec.needs_api and replies and not failed:
+                self._recent_replies.set(reply_key, replies)
+            self._metrics.observe("command_seconds", elapsed, command=spec.name)
+            if failed:
+                self._metrics.inc("command_errors_total", command=spec.name)
+
+    def _throttle(self, event: AstrMessageEvent, spec: "CommandSpec", reply_key: tuple) -> Optional[List[str]]:
+        """按 (群, 用户, 命令) 和 (群, 命令) 限流，私聊的“群”为该用户自己；放行时返回 None
+
+        超限时不请求论坛：本群最近 command_window 秒内有相同查询的结果就直接返回它，否则回复冷却提示。
+        """
+        target = reply_key[1]
+        user_id = str(event.get_sender_id() or "")
+        wait = self._command_limiter.acquire([
+            ((target, user_id, spec.name), self.cfg.command_user_limit),
+            ((target, spec.name), self.cfg.command_group_limit),
+        ])
+        if not wait:
+            return None
+
+        hit = self._recent_replies.get(reply_key)
+        if hit is not None and hit[1] <= self._command_limiter.window:
+            replies, age = hit
+            self._metrics.inc("command_throttled_total", command=spec.name, result="cached")
+            return replies[:-1] + [replies[-1] + f"\n⏳ 查询太频繁，以上为 {int(age)} 秒前的结果"]
+        self._metrics.inc("command_throttled_total", command=spec.name, result="cooldown")
+        return [f"⏳ 查询太频繁，请 {math.ceil(wait)} 秒后再试"]
+
+    async def _cmd_forum(self, arg: str) -> AsyncIterator[str]:
+        async for chunk in self._stream_latest_threads(limit=int(self.cfg.threads_limit or 5)):
+            yield chunk
+
+    async def _cmd_user(self, arg: str) -> AsyncIterator[str]:
+        yield await self._fetch_user_info_text(arg)
+
+    async def _cmd_thread(self, arg: str) -> AsyncIterator[str]:
+        # 参数会拼进接口路径，只接受纯数字
+        if not (arg.isascii() and arg.isdigit()):
+            yield self._commands["主题"].usage
             return
+        yield await self._fetch_thread_detail_text(arg)
 
-        try:
-            text = await asyncio.to_thread(
-                self._fetch_latest_posts_text,
-                limit=5,
-            )
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取回复失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
+    async def _cmd_posts(self, arg: str) -> AsyncIterator[str]:
+        yield await self._fetch_latest_posts_text(limit=5)
 
-    @xf.command("统计")
-    async def stats(self, event: AstrMessageEvent):
-        """获取论坛统计: xf 统计"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
+    async def _cmd_stats(self, arg: str) -> AsyncIterator[str]:
+        yield await self._fetch_forum_stats_text()
 
-        try:
-            text = await asyncio.to_thread(self._fetch_forum_stats_text)
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取统计失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
+    async def _cmd_forums(self, arg: str) -> AsyncIterator[str]:
+        async for chunk in self._stream_forums_list():
+            yield chunk
 
-    @xf.command("板块")
-    async def forums(self, event: AstrMessageEvent):
-        """获取板块列表: xf 板块"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
+    async def _cmd_hot(self, arg: str) -> AsyncIterator[str]:
+        yield await self._fetch_hot_threads_text(limit=5)
 
-        try:
-            text = await asyncio.to_thread(self._fetch_forums_list_text)
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取板块失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
+    async def _cmd_search(self, arg: str) -> AsyncIterator[str]:
+        yield self._search_threads_text(arg)
 
-    @xf.command("热门")
-    async def hot(self, event: AstrMessageEvent):
-        """获取热门主题: xf 热门"""
-        err = self._ensure_ready()
-        if err:
-            yield event.plain_result(err)
-            return
+    async def _cmd_help(self, arg: str) -> AsyncIterator[str]:
+        yield self._get_help_text()
 
-        try:
-            text = await asyncio.to_thread(
-                self._fetch_hot_threads_text,
-                limit=5,
-            )
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取热门主题失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
+    async def _cmd_reload(self, arg: str) -> AsyncIterator[str]:
+        await self._reload_cfg()
+        yield "✅ 配置已重新加载"
 
-    @xf.command("帮助")
-    async def help(self, event: AstrMessageEvent):
-        """显示帮助信息: xf 帮助"""
-        try:
-            text = self._get_help_text()
-            yield event.plain_result(text)
-        except Exception as e:
-            logger.error(f"[XenForo] 获取帮助失败: {e}")
-            yield event.plain_result(f"出错了: {str(e)}")
+    async def _cmd_status(self, arg: str) -> AsyncIterator[str]:
+        yield self._status_text()
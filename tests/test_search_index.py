@@ -0,0 +1,123 @@
+"""ThreadSearchIndex：增量写入、合并到磁盘、mmap 加载后的查询，以及站点切换"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+from harness import REPO_ROOT, install_fake_astrbot  # noqa: E402
+
+install_fake_astrbot()
+sys.path.insert(0, REPO_ROOT)
+
+from main import ThreadSearchIndex  # noqa: E402
+
+SITE = "http://forum.test"
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workdir.name, "search_index.bin")
+        self.index = ThreadSearchIndex(self.path, SITE)
+
+    def tearDown(self):
+        self.index.close()
+        self.workdir.cleanup()
+
+    def compact(self, index: ThreadSearchIndex) -> bool:
+        delta, site = index.snapshot()
+        merged = index.compact(delta, site)
+        index.finish_compact(delta if merged else {})
+        return merged
+
+    def test_tokenize(self):
+        tokens = ThreadSearchIndex.tokenize("插件安装 MySQL-8")
+        self.assertTrue({"插", "插件", "件安", "mysql", "8"} <= tokens)
+        self.assertEqual(ThreadSearchIndex.query_tokens("插件安装"), {"插件", "件安", "安装"})
+
+    def test_round_trip(self):
+        self.index.add(1, "插件安装问题", "服务器报错 [b]mysql[/b] timeout")
+        self.index.add(2, "主题二", "redis 配置")
+        self.assertTrue(self.compact(self.index))
+        self.assertEqual(self.index.pending, 0)
+
+        reopened = ThreadSearchIndex(self.path, SITE)
+        reopened.load()
+        try:
+            self.assertEqual(len(reopened), 2)
+            self.assertEqual(reopened.search("mysql"), [(1, "插件安装问题")])
+            self.assertEqual(reopened.search("安装"), [(1, "插件安装问题")])
+            self.assertEqual(reopened.search("redis"), [(2, "主题二")])
+            self.assertEqual(reopened.search("nginx"), [])
+            # BBCode 标签本身不进入索引
+            self.assertEqual(reopened.search("b"), [])
+        finally:
+            reopened.close()
+
+    def test_unchanged_content_is_skipped(self):
+        self.assertTrue(self.index.add(1, "标题", "正文"))
+        self.assertFalse(self.index.add(1, "标题", "正文"))
+        self.assertFalse(self.index.add(1, "标题"))
+        self.compact(self.index)
+        self.assertFalse(self.index.add(1, "标题", "正文"))
+        self.assertEqual(self.index.pending, 0)
+
+    def test_delta_overrides_base(self):
+        self.index.add(1, "旧标题", "nginx")
+        self.compact(self.index)
+        self.index.add(1, "旧标题", "apache")
+        self.assertEqual(self.index.search("nginx"), [])
+        self.assertEqual(self.index.search("apache"), [(1, "旧标题")])
+        self.compact(self.index)
+        self.assertEqual(self.index.search("nginx"), [])
+        self.assertEqual(self.index.search("apache"), [(1, "旧标题")])
+
+    def test_title_only_rename_keeps_first_post(self):
+        self.index.add(1, "插件安装问题", "mysql timeout")
+        self.index.add(1, "已解决：插件安装", "")
+        self.assertEqual(self.index.search("mysql"), [(1, "已解决：插件安装")])
+
+        self.index.add(2, "旧标题", "redis 配置")
+        self.compact(self.index)
+        self.index.add(2, "新标题", "")
+        self.assertEqual(self.index.search("redis"), [(2, "新标题")])
+        self.assertEqual(self.index.search("新标题"), [(2, "新标题")])
+        self.compact(self.index)
+        self.assertEqual(self.index.search("redis"), [(2, "新标题")])
+        self.assertEqual(self.index.search("mysql"), [(1, "已解决：插件安装")])
+
+    def test_site_mismatch_on_load(self):
+        self.index.add(1, "主题一", "正文")
+        self.compact(self.index)
+        other = ThreadSearchIndex(self.path, "http://other.test")
+        other.load()
+        try:
+            self.assertEqual(len(other), 0)
+            self.assertEqual(other.search("主题"), [])
+        finally:
+            other.close()
+
+    def test_reset_during_compaction(self):
+        self.index.add(1, "旧站点主题", "正文")
+        self.compact(self.index)
+        self.index.add(2, "旧站点主题二", "")
+
+        delta, site = self.index.snapshot()
+        self.index.reset("http://other.test")
+        # 合并线程还在读基础段：旧站点的内容不再可查，但 mmap 还在
+        self.assertEqual(self.index.search("旧站点"), [])
+        self.assertFalse(self.index.compact(delta, site))
+        self.index.finish_compact({})
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        self.assertEqual(len(self.index), 0)
+
+        self.index.add(3, "新站点主题", "")
+        self.assertTrue(self.compact(self.index))
+        self.assertEqual(self.index.search("站点"), [(3, "新站点主题")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""_stream_list 分段输出：页眉、出错提示和缓存提示触发分段时内容不能丢"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+from harness import load_plugin  # noqa: E402
+
+
+def forum(node_id: int) -> dict:
+    return {"node_id": node_id, "title": f"板块 {node_id}", "discussion_count": node_id}
+
+
+class StreamListTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.plugin, _ = load_plugin(
+            {"xf_url": "http://forum.test", "xf_api_key": "key", "reply_chunk_size": 200}, self.workdir.name
+        )
+        self.main = sys.modules["main"]
+
+    async def asyncTearDown(self):
+        await self.plugin.terminate()
+        self.workdir.cleanup()
+
+    def use_pages(self, pages: list) -> None:
+        async def iter_pages(path, params, max_items=0):
+            for page in pages:
+                yield page
+
+        self.plugin._iter_pages = iter_pages
+
+    async def collect(self) -> list:
+        return [chunk async for chunk in self.plugin._stream_forums_list()]
+
+    async def test_stale_notice_flushes(self):
+        self.use_pages([({"forums": [forum(i) for i in range(1, 4)], self.main.STALE_KEY: 120}, None)])
+        chunks = await self.collect()
+        text = "".join(chunks)
+        self.assertTrue(chunks)
+        for i in range(1, 4):
+            self.assertIn(f"板块 {i}", text)
+        self.assertIn("缓存数据", text)
+
+    async def test_error_trailer_flushes(self):
+        self.use_pages([({"forums": [forum(i) for i in range(1, 4)]}, None), (None, "请求失败: 服务器返回了无法解析的内容")])
+        text = "".join(await self.collect())
+        for i in range(1, 4):
+            self.assertIn(f"板块 {i}", text)
+        self.assertIn("后续内容加载失败: 请求失败: 服务器返回了无法解析的内容", text)
+
+    async def test_empty_list(self):
+        self.use_pages([({"forums": []}, None)])
+        self.assertEqual(await self.collect(), ["暂无板块"])
+
+
+if __name__ == "__main__":
+    unittest.main()